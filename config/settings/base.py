@@ -372,6 +372,28 @@ BOOK_IMAGE_SIZES = [
 BOOK_SPECIAL_WORDS = ["shollallohu 'alaihi wa sallam", "shollallohu 'alaihi wasallam"]
 FONTS_DIRECTORY = env.str("FONTS_DIRECTORY", default="/home/ihfazh/fonts/")
 BOOK_STORAGE_MEDIA = str(APPS_DIR / "books_media")
+# seconds to wait before rendering a saved book, page saves inside it are coalesced
+BOOK_RENDER_DEBOUNCE = env.int("BOOK_RENDER_DEBOUNCE", default=10)
+# seconds a render holds its book, from queueing its pages to writing the manifest.
+# It covers the queue latency of a forced render of every book, the lock is released early when it finishes
+BOOK_RENDER_LOCK_TIMEOUT = env.int("BOOK_RENDER_LOCK_TIMEOUT", default=2 * 60 * 60)
+BOOK_ASSET_UPLOAD_WORKERS = env.int("BOOK_ASSET_UPLOAD_WORKERS", default=8)
+# "png" or "webp" (lossless), the mobile app must support the chosen format
+BOOK_IMAGE_ENCODER = {
+    "format": env.str("BOOK_IMAGE_FORMAT", default="png"),
+    "compress_level": env.int("BOOK_IMAGE_PNG_COMPRESS_LEVEL", default=6),
+    "quantize": env.bool("BOOK_IMAGE_PNG_QUANTIZE", default=False),
+}
+# bytes of a book bundle kept in memory while packing, the rest spools to disk
+BOOK_BUNDLE_SPOOL_SIZE = env.int("BOOK_BUNDLE_SPOOL_SIZE", default=16 * 1024 * 1024)
+BOOK_DETAIL_CACHE_TIMEOUT = env.int("BOOK_DETAIL_CACHE_TIMEOUT", default=24 * 60 * 60)
+# valid download tokens and audio timestamps, both are invalidated when they change
+BOOK_AUDIO_CACHE_TIMEOUT = env.int("BOOK_AUDIO_CACHE_TIMEOUT", default=60 * 60)
+BOOK_AUDIO_DOWNLOADS_PER_TOKEN = env.int("BOOK_AUDIO_DOWNLOADS_PER_TOKEN", default=2)
+# the daily task board of a child, updated in place when a task changes status
+CHILDREN_TASK_BOARD_TIMEOUT = env.int("CHILDREN_TASK_BOARD_TIMEOUT", default=10 * 60)
+# token -> board and label -> sensor of the sensor logging, invalidated when they change
+SENSOR_CACHE_TIMEOUT = env.int("SENSOR_CACHE_TIMEOUT", default=60 * 60)
 
 
 LOOM_SDK_PEM = env.str("LOOM_SDK_PEM", default="hello")
@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
 from ksatria_muslim.books.models import Book, BookReference, Page, BookState
+from ksatria_muslim.children.models import Child
 
 User = get_user_model()
 
@@ -73,3 +74,28 @@ class BookStateSerializer(serializers.ModelSerializer):
             "is_gift_opened",
             "locked"
         ]
+
+
+class ReadingEventSerializer(serializers.Serializer):
+    # the same id is sent by the start and the finish of one reading
+    id = serializers.UUIDField()
+    type = serializers.ChoiceField(choices=["start", "finish"])
+    book_id = serializers.IntegerField()
+    child_id = serializers.IntegerField()
+    timestamp = serializers.DateTimeField(input_formats=["iso-8601", "%Y%m%d%H%M%S"])
+
+
+class ReadingEventsSerializer(serializers.Serializer):
+    events = ReadingEventSerializer(many=True)
+
+    def validate(self, attrs):
+        # checked once for the whole batch instead of a query per event
+        book_ids = {event["book_id"] for event in attrs["events"]}
+        if Book.objects.filter(id__in=book_ids).count() != len(book_ids):
+            raise serializers.ValidationError({"events": "book not found"})
+
+        child_ids = {event["child_id"] for event in attrs["events"]}
+        if Child.objects.filter(id__in=child_ids).count() != len(child_ids):
+            raise serializers.ValidationError({"events": "child not found"})
+
+        return attrs
@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
+from django.utils.http import http_date, parse_etags, quote_etag
 from rest_framework.decorators import action, api_view
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from .serializers import BookSerializer, BookDetailSerializer, BookStateSerializer
+from .serializers import BookSerializer, BookDetailSerializer, BookStateSerializer, ReadingEventsSerializer
+from ..cache import book_detail_cache_key, get_book_detail_etag, get_book_last_modified
 from ..models import Book, BookState, ChildBookReadingHistory
 from ..tasks import process_book
 from ...utils.pagination import KsatriaMuslimPagination
@@ -24,7 +30,36 @@ class BookViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
         return self.serializer_class
 
     def get_queryset(self):
-        return self.queryset.order_by("-id")
+        qs = self.queryset.order_by("-id")
+        if self.action == "retrieve":
+            # the pages are prefetched only when the detail is not cached
+            qs = qs.select_related("reference")
+        return qs
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Books rarely change, the serialized detail is cached per book until the book
+        or its pages change, and clients sending If-None-Match get a 304.
+        """
+        book = self.get_object()
+        last_modified, page_count = get_book_last_modified(book)
+        etag = quote_etag(get_book_detail_etag(book.pk, last_modified, page_count))
+        headers = {"ETag": etag, "Last-Modified": http_date(last_modified.timestamp())}
+
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            return Response(status=304, headers=headers)
+
+        cache_key = book_detail_cache_key(book.pk, request.get_host())
+        cached = cache.get(cache_key)
+        if cached and cached[0] == etag:
+            data = cached[1]
+        else:
+            prefetch_related_objects([book], "page_set")
+            data = self.get_serializer(book).data
+            cache.set(cache_key, (etag, data), settings.BOOK_DETAIL_CACHE_TIMEOUT)
+
+        return Response(data, headers=headers)
 
     @action(detail=True, methods=["POST"])
     def update_state(self, request, pk=None):
@@ -77,10 +112,51 @@ class BookViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
         if history:
             history.finished = timezone.now()
             history.save()
+            BookState.record_finished([history])
             return Response({"status": "ok"})
 
         return Response({"status": "error", "message": "no history found"})
 
+    @action(detail=False, methods=["POST"])
+    def sync(self, request):
+        """
+        Apply the start and finish events buffered by an offline device in one request.
+        Readings are identified by the id given by the device, so replaying is idempotent.
+        """
+        serializer = ReadingEventsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        events = serializer.validated_data["events"]
+
+        with transaction.atomic():
+            ChildBookReadingHistory.objects.bulk_create(
+                [
+                    ChildBookReadingHistory(
+                        client_id=event["id"],
+                        book_id=event["book_id"],
+                        child_id=event["child_id"],
+                        created=event["timestamp"],
+                    )
+                    for event in events
+                    if event["type"] == "start"
+                ],
+                ignore_conflicts=True,
+            )
+
+            finished_at = {event["id"]: event["timestamp"] for event in events if event["type"] == "finish"}
+            histories = list(
+                ChildBookReadingHistory.objects.select_for_update().filter(
+                    client_id__in=finished_at, finished__isnull=True
+                )
+            )
+            now = timezone.now()
+            for history in histories:
+                history.finished = finished_at[history.client_id]
+                history.modified = now
+            ChildBookReadingHistory.objects.bulk_update(histories, ["finished", "modified"])
+            BookState.record_finished(histories)
+
+        return Response({"status": "ok", "finished": len(histories)})
+
 
 class BookStateViewSet(ListModelMixin, GenericViewSet):
     serializer_class = BookStateSerializer
@@ -103,5 +179,5 @@ class BookStateViewSet(ListModelMixin, GenericViewSet):
 @api_view(["GET"])
 def force_generate_images(request):
     for book in Book.objects.all():
-        process_book.delay(book.id)
+        process_book.delay(book.id, force=True)
     return Response({"status": "ok"})
@@ -1,4 +1,11 @@
+import datetime
+import os
+import shutil
+import uuid
+import zipfile
+
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import FileSystemStorage
 from django.utils.functional import LazyObject
 
@@ -11,3 +18,95 @@ class BookStorage(LazyObject):
 
 
 book_storage = BookStorage()
+
+AUDIO_TIMESTAMP_KEY = "books:audio-timestamp:{}"
+
+
+def audio_base_path(book_id):
+    return f"{book_id}/audio/"
+
+
+def get_audio_timestamp(book_id):
+    """
+    :return: timestamp written by the last audio upload, None if there is none
+    """
+    timestamp = cache.get(AUDIO_TIMESTAMP_KEY.format(book_id))
+    if timestamp is None:
+        path = f"{audio_base_path(book_id)}timestamp"
+        timestamp = ""
+        if book_storage.exists(path):
+            with book_storage.open(path, "r") as f:
+                timestamp = f.read().strip()
+        cache.set(AUDIO_TIMESTAMP_KEY.format(book_id), timestamp, settings.BOOK_AUDIO_CACHE_TIMEOUT)
+    return timestamp or None
+
+
+def save_audio_timestamp(book_id):
+    timestamp = str(datetime.datetime.now().timestamp())
+    with open(book_storage.path(f"{audio_base_path(book_id)}timestamp"), "w") as f:
+        f.write(timestamp)
+    cache.set(AUDIO_TIMESTAMP_KEY.format(book_id), timestamp, settings.BOOK_AUDIO_CACHE_TIMEOUT)
+
+
+def audio_zip_path(book_id, timestamp):
+    # outside of the audio directory, so it is not zipped itself
+    return f"{book_id}/audio-zip/{timestamp}.zip"
+
+
+def clear_audio_zips(book_id):
+    shutil.rmtree(book_storage.path(f"{book_id}/audio-zip/"), ignore_errors=True)
+
+
+class _ChunkBuffer:
+    """unseekable zip output, written bytes go to the file and wait to be streamed"""
+
+    def __init__(self, file):
+        self.file = file
+        self.chunks = []
+
+    def write(self, data):
+        self.file.write(data)
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def pop(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def stream_audio_zip(book_id, files, cache_path=None):
+    """
+    zip the audio files, yielding the archive one member at a time
+
+    :param book_id: book id
+    :param files: names of the files in the audio directory
+    :param cache_path: where the finished archive is kept, it is only moved there once complete
+    :return: generator of the archive bytes
+    """
+    base_path = audio_base_path(book_id)
+    if cache_path:
+        os.makedirs(os.path.dirname(book_storage.path(cache_path)), exist_ok=True)
+        temp_path = book_storage.path(f"{cache_path}.{uuid.uuid4().hex}.tmp")
+    else:
+        temp_path = None
+
+    completed = False
+    with open(temp_path or os.devnull, "wb") as output:
+        buffer = _ChunkBuffer(output)
+        try:
+            with zipfile.ZipFile(buffer, "w") as compressor:
+                for file in files:
+                    compressor.write(book_storage.path(f"{base_path}{file}"), arcname=file)
+                    yield buffer.pop()
+            yield buffer.pop()
+            completed = True
+        finally:
+            output.close()
+            if temp_path and completed:
+                os.replace(temp_path, book_storage.path(cache_path))
+            elif temp_path:
+                # the download was cut off, don't keep a partial archive
+                os.remove(temp_path)
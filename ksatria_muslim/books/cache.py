@@ -0,0 +1,84 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from rest_framework.authtoken.models import Token
+
+BOOK_DETAIL_CACHE_KEY = "books:detail:{}:{}:{}"
+BOOK_DETAIL_VERSION_KEY = "books:detail-version:{}"
+AUDIO_TOKEN_KEY = "books:audio-token:{}"
+AUDIO_DOWNLOADS_KEY = "books:audio-downloads:{}"
+# the counters are released when a download ends, the timeout only matters when a worker died
+AUDIO_DOWNLOADS_TIMEOUT = 30 * 60
+
+
+def get_book_last_modified(book):
+    """
+    :return: (last modified time of the book, its reference and its pages, page count)
+    """
+    pages = book.page_set.aggregate(last_modified=models.Max("modified"), count=models.Count("id"))
+    candidates = [book.modified, pages["last_modified"]]
+    if book.reference:
+        candidates.append(book.reference.modified)
+    return max(candidate for candidate in candidates if candidate), pages["count"]
+
+
+def get_book_detail_etag(book_id, last_modified, page_count):
+    # the count catches deleted pages, they don't move the last modified time
+    value = f"{book_id}:{last_modified.isoformat()}:{page_count}"
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def book_detail_cache_key(book_id, host):
+    # the serialized urls are absolute, so they depend on the requested host
+    version = cache.get(BOOK_DETAIL_VERSION_KEY.format(book_id), 0)
+    return BOOK_DETAIL_CACHE_KEY.format(book_id, version, host)
+
+
+def invalidate_book_detail(book_id):
+    cache.set(BOOK_DETAIL_VERSION_KEY.format(book_id), time.time_ns(), None)
+
+
+def is_valid_audio_token(key):
+    # only valid tokens are cached, random ones must not fill the cache
+    if len(key) > Token._meta.get_field("key").max_length:
+        return False
+    cache_key = AUDIO_TOKEN_KEY.format(key)
+    if cache.get(cache_key):
+        return True
+    if not Token.objects.filter(key=key).exists():
+        return False
+    cache.set(cache_key, True, settings.BOOK_AUDIO_CACHE_TIMEOUT)
+    return True
+
+
+def invalidate_audio_token(key):
+    cache.delete(AUDIO_TOKEN_KEY.format(key))
+
+
+def acquire_audio_download(key):
+    """
+    :return: False when the token already has `BOOK_AUDIO_DOWNLOADS_PER_TOKEN` downloads running
+    """
+    cache_key = AUDIO_DOWNLOADS_KEY.format(key)
+    cache.add(cache_key, 0, AUDIO_DOWNLOADS_TIMEOUT)
+    try:
+        count = cache.incr(cache_key)
+    except ValueError:
+        # expired right after the add
+        cache.set(cache_key, 1, AUDIO_DOWNLOADS_TIMEOUT)
+        count = 1
+
+    if count > settings.BOOK_AUDIO_DOWNLOADS_PER_TOKEN:
+        release_audio_download(key)
+        return False
+    return True
+
+
+def release_audio_download(key):
+    try:
+        cache.decr(AUDIO_DOWNLOADS_KEY.format(key))
+    except ValueError:
+        pass
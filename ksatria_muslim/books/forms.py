@@ -1,13 +1,43 @@
-import datetime
 import json
 import os
 import zipfile
+import zlib
 
 from django import forms
-from django.core.files.storage import default_storage
 
-from ksatria_muslim.books.book_storage import book_storage
+from ksatria_muslim.books.book_storage import book_storage, clear_audio_zips, save_audio_timestamp
 from ksatria_muslim.books.models import Book
+from ksatria_muslim.utils.book_image import load_bundle_index
+from ksatria_muslim.utils.storage import read_files
+
+
+def get_page_texts(book):
+    """
+    :return: [(page, [text of each bounding box])] from the hdpi metadata
+    """
+    pages = list(book.page_set.values_list("page", flat=True))
+
+    # the bundle index merges the metadata of every page, one read instead of one per page
+    index = load_bundle_index(book.id, "hdpi")
+    if index and [item["page"] for item in index["pages"]] == pages:
+        return [
+            (item["page"], [data.get("text") for data in item["page_data"]])
+            for item in index["pages"]
+        ]
+
+    paths = [f"book_image_metadata/books/{book.id}/{page}-hdpi.json" for page in pages]
+    return [
+        (page, [data.get("text") for data in metadata.get("page_data", [])])
+        for page, metadata in zip(pages, read_files(paths, json.load))
+    ]
+
+
+def file_crc(path, chunk_size=64 * 1024):
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            crc = zlib.crc32(chunk, crc)
+    return crc
 
 
 class UploadAudioForm(forms.Form):
@@ -20,44 +50,52 @@ class UploadAudioForm(forms.Form):
     def clean_zip_file(self):
         data = self.cleaned_data["zip_file"]
 
-        paths = []
-        for page in self.book.page_set.all():
-            fname = f"book_image_metadata/books/{self.book.id}/{page.page}-hdpi.json"
-            paths.append((fname, page))
-
         rows = []
-        for path, page in paths:
-            f = default_storage.open(path)
-            metadata = json.load(f)
-            for index, item in enumerate(metadata.get("page_data", [])):
+        for page, texts in get_page_texts(self.book):
+            for index, text in enumerate(texts):
                 # ganti kalau sudah mp3
-                rows.append([f"{self.book.id}_{page.page}_{index}.mp3", item.get("text")])
-
-        with zipfile.ZipFile(data, "r") as compressed:
-            # first layer: validate extension
-            for file in compressed.namelist():
-                if not file.endswith("mp3") and not file.endswith("csv"):
-                    raise forms.ValidationError("File ada yang bukan mp3")
-
-            # second layer: validate file page
-            for item, text in rows:
-                if item not in compressed.namelist():
-                    raise forms.ValidationError(f"File {item} tidak ditemukan di zipfile. text: {text}")
-
+                rows.append([f"{self.book.id}_{page}_{index}.mp3", text])
+
+        try:
+            compressed = zipfile.ZipFile(data, "r")
+        except zipfile.BadZipFile:
+            raise forms.ValidationError("File bukan zip")
+        names = set(compressed.namelist())
+
+        # first layer: validate extension
+        for file in names:
+            if not file.endswith("mp3") and not file.endswith("csv"):
+                raise forms.ValidationError("File ada yang bukan mp3")
+
+        # second layer: validate file page
+        for item, text in rows:
+            if item not in names:
+                raise forms.ValidationError(f"File {item} tidak ditemukan di zipfile. text: {text}")
+
+        # kept open for `save`, the archive is only indexed once
+        self.compressed = compressed
         return data
 
     def save(self):
         base_path = f"{self.book.id}/audio/"
-
-        if not book_storage.exists(base_path):
-            os.makedirs(
-                book_storage.path(base_path),
-                exist_ok=True
-            )
-
-        with zipfile.ZipFile(self.cleaned_data["zip_file"], "r") as compressed:
-            compressed.extractall(book_storage.path(base_path))
-
-        with open(book_storage.path(base_path + "timestamp"), "w") as timestamp:
-            timestamp.write(str(datetime.datetime.now().timestamp()))
-
+        target = book_storage.path(base_path)
+        os.makedirs(target, exist_ok=True)
+
+        changed = not os.path.exists(os.path.join(target, "timestamp"))
+        with self.compressed as compressed:
+            for info in compressed.infolist():
+                path = os.path.join(target, info.filename)
+                # unchanged members are skipped, the size check avoids reading most of them
+                if (
+                    os.path.exists(path)
+                    and os.path.getsize(path) == info.file_size
+                    and file_crc(path) == info.CRC
+                ):
+                    continue
+                compressed.extract(info, target)
+                changed = True
+
+        if changed:
+            save_audio_timestamp(self.book.id)
+            # archives of the previous upload are stale now
+            clear_audio_zips(self.book.id)
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.9 on 2026-10-17 21:42
+
+from django.db import migrations, models
+
+
+def backfill_finished(apps, schema_editor):
+    book_state = apps.get_model("books", "BookState")
+    history = apps.get_model("books", "ChildBookReadingHistory")
+
+    finished = history.objects.filter(
+        book=models.OuterRef("book"), child=models.OuterRef("child"), finished__isnull=False
+    )
+    states = book_state.objects.annotate(
+        history_count=models.Subquery(
+            finished.values("book").annotate(count=models.Count("id")).values("count")
+        ),
+        history_started_at=models.Subquery(finished.order_by("-finished").values("created")[:1]),
+    )
+
+    updated = []
+    for state in states:
+        state.finished_count = state.history_count or 0
+        state.last_finished_started_at = state.history_started_at
+        updated.append(state)
+    book_state.objects.bulk_update(updated, ["finished_count", "last_finished_started_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0007_childbookreadinghistory_finished"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookstate",
+            name="finished_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="bookstate",
+            name="last_finished_started_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Start of the latest finished reading", null=True
+            ),
+        ),
+        migrations.RunPython(backfill_finished, reverse_code=migrations.RunPython.noop),
+    ]
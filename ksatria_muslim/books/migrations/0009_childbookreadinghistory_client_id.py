@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-17 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_bookstate_finished_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="childbookreadinghistory",
+            name="client_id",
+            field=models.UUIDField(blank=True, null=True, unique=True),
+        ),
+    ]
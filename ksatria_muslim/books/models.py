@@ -1,9 +1,13 @@
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from model_utils.models import TimeStampedModel
+from rest_framework.authtoken.models import Token
 
+from ksatria_muslim.books.cache import invalidate_audio_token, invalidate_book_detail
 from ksatria_muslim.children.models import Child
 from ksatria_muslim.utils.book_image import is_arabic, process_page_image
 
@@ -46,10 +50,33 @@ class Page(TimeStampedModel):
 
 @receiver(post_save, sender=Page)
 def update_page_image(sender, instance: Page, **kwargs):
-    # not the best place, we will run multiple times if we create a new book
-    from ksatria_muslim.books.tasks import process_book
+    # saving a book with its pages fires this for every page,
+    # the scheduler coalesces them into one render
+    from ksatria_muslim.books.tasks import schedule_process_book
 
-    process_book.delay(instance.book_id)
+    book_id = instance.book_id
+    invalidate_book_detail(book_id)
+    transaction.on_commit(lambda: schedule_process_book(book_id))
+
+
+@receiver(post_delete, sender=Page)
+def invalidate_deleted_page_book(sender, instance: Page, **kwargs):
+    from ksatria_muslim.books.tasks import schedule_process_book
+
+    # the bundles still hold the page until the book is rendered again
+    book_id = instance.book_id
+    invalidate_book_detail(book_id)
+    transaction.on_commit(lambda: schedule_process_book(book_id))
+
+
+@receiver(post_save, sender=Book)
+def invalidate_book(sender, instance: Book, **kwargs):
+    invalidate_book_detail(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_audio_token(sender, instance: Token, **kwargs):
+    invalidate_audio_token(instance.key)
 
 
 class BookState(TimeStampedModel):
@@ -57,24 +84,46 @@ class BookState(TimeStampedModel):
     child = models.ForeignKey(Child, on_delete=models.CASCADE)
     is_gift_opened = models.BooleanField(default=False)
 
+    # kept by `record_finished`, so `locked` doesn't need to scan the reading history
+    finished_count = models.PositiveIntegerField(default=0)
+    last_finished_started_at = models.DateTimeField(
+        null=True, blank=True, help_text="Start of the latest finished reading"
+    )
+
     class Meta:
         unique_together = ["book", "child"]
 
     @property
     def locked(self):
-        latest_history = ChildBookReadingHistory.objects.filter(
-            child=self.child, book=self.book, finished__isnull=False
-        ).order_by("-finished")[:]
-        if not latest_history:
+        if not self.finished_count:
             return False
 
-        days_delta = (timezone.now() - latest_history[0].created).days
-        multiples_of_ten = len(latest_history) % 10 == 0
+        days_delta = (timezone.now() - self.last_finished_started_at).days
+        multiples_of_ten = self.finished_count % 10 == 0
 
         return multiples_of_ten and days_delta <= 3
 
+    @classmethod
+    def record_finished(cls, histories):
+        """update the counters of the states after their reading histories are finished"""
+        grouped = {}
+        for history in histories:
+            grouped.setdefault((history.book_id, history.child_id), []).append(history)
+
+        for (book_id, child_id), finished in grouped.items():
+            state, _ = cls.objects.get_or_create(book_id=book_id, child_id=child_id)
+            # replayed offline readings may be older than the latest one already counted
+            cls.objects.filter(pk=state.pk).update(
+                finished_count=models.F("finished_count") + len(finished),
+                last_finished_started_at=Greatest(
+                    "last_finished_started_at", Value(max(history.created for history in finished))
+                ),
+            )
+
 
 class ChildBookReadingHistory(TimeStampedModel):
     child = models.ForeignKey(Child, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     finished = models.DateTimeField(null=True, blank=True)
+    # id given by the device, makes replayed offline events idempotent
+    client_id = models.UUIDField(null=True, blank=True, unique=True)
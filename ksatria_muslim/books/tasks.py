@@ -1,11 +1,32 @@
+import uuid
+
+from celery import chord
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 
 from config import celery_app
 from ksatria_muslim.books.models import Book
-from ksatria_muslim.utils.book_image import is_arabic, process_page_image, stamp_book
+from ksatria_muslim.utils.book_image import (
+    is_arabic,
+    book_bundle_path,
+    load_render_manifest,
+    pack_book_bundle,
+    page_render_key,
+    process_page_image,
+    save_render_manifest,
+    stamp_book,
+)
+from ksatria_muslim.utils.storage import AssetWriter
 
 User = get_user_model()
 
+RENDER_SCHEDULED_KEY = "books:render-scheduled:{}"
+# set while a forced render is waiting, the scheduled render takes it over
+RENDER_FORCE_KEY = "books:render-force:{}"
+# the token of the render holding the book, released by `stamp_book_pages`
+RENDER_RUNNING_KEY = "books:render-running:{}"
+
 
 @celery_app.task()
 def get_users_count():
@@ -13,11 +34,113 @@ def get_users_count():
     return User.objects.count()
 
 
+def schedule_process_book(book_id, force=False):
+    """
+    Queue `process_book` after `BOOK_RENDER_DEBOUNCE` seconds. Requests coming
+    while one is already queued for the book are dropped, the queued render
+    picks up their changes, and their `force`.
+    """
+    timeout = settings.BOOK_RENDER_DEBOUNCE + settings.BOOK_RENDER_LOCK_TIMEOUT
+    if force:
+        # set first, so the queued render can't start before seeing it
+        cache.set(RENDER_FORCE_KEY.format(book_id), True, timeout)
+
+    if cache.add(RENDER_SCHEDULED_KEY.format(book_id), True, timeout):
+        process_book.apply_async((book_id, force), countdown=settings.BOOK_RENDER_DEBOUNCE)
+
+
+def release_render(book_id, token):
+    """
+    unlock the book, unless the render of the token lost it to another one
+    """
+    key = RENDER_RUNNING_KEY.format(book_id)
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
 @celery_app.task()
-def process_book(book_id):
-    book = Book.objects.get(pk=book_id)
-    for page in book.page_set.all():
-        file_name = f"books/{book_id}/{page.page}"
-        arabic = is_arabic(page.text)
-        process_page_image(page.text, file_name, arabic)
-        stamp_book(f"books/{book_id}/{page.page}/stamp")
+def process_book(book_id, force=False):
+    """
+    Fan out the book rendering, one sub task for each page rendering all of its sizes
+    from one layout. Only the page sizes whose render key differs from the manifest are rendered,
+    unless `force` is given. The bundles, the stamp files and the new manifest
+    are written by `stamp_book_pages` once all of them finished.
+    """
+    cache.delete(RENDER_SCHEDULED_KEY.format(book_id))
+    # deleting tells whether a forced render was scheduled meanwhile
+    force = cache.delete(RENDER_FORCE_KEY.format(book_id)) or force
+    book = Book.objects.filter(pk=book_id).first()
+    if not book:
+        # deleted with its pages
+        return
+
+    token = uuid.uuid4().hex
+    if not cache.add(RENDER_RUNNING_KEY.format(book_id), token, settings.BOOK_RENDER_LOCK_TIMEOUT):
+        # the running render may miss the latest changes, try again after it
+        schedule_process_book(book_id, force)
+        return
+
+    manifest = {} if force else load_render_manifest(book_id)
+
+    header = []
+    changed_pages = []
+    new_manifest = {}
+    for page, text in book.page_set.values_list("page", "text"):
+        arabic = is_arabic(text)
+        rendered = manifest.get(str(page), {})
+        keys = {}
+        size_indexes = []
+        for size_index, size in enumerate(settings.BOOK_IMAGE_SIZES):
+            keys[size[2]] = page_render_key(text, size, arabic)
+            if rendered.get(size[2]) != keys[size[2]]:
+                size_indexes.append(size_index)
+
+        if size_indexes:
+            header.append(process_page.si(book_id, page, text, size_indexes))
+        if keys != rendered:
+            changed_pages.append(page)
+        new_manifest[str(page)] = keys
+
+    if not header:
+        # nothing to render, but pages may have been removed
+        if new_manifest != manifest:
+            stamp_book_pages(book_id, [], new_manifest, token)
+        else:
+            release_render(book_id, token)
+        return
+
+    try:
+        chord(header)(stamp_book_pages.si(book_id, changed_pages, new_manifest, token))
+    except Exception:
+        # eager renders raise here, don't keep the book locked
+        release_render(book_id, token)
+        raise
+
+
+@celery_app.task()
+def process_page(book_id, page, text, size_indexes):
+    file_name = f"books/{book_id}/{page}"
+    sizes = [settings.BOOK_IMAGE_SIZES[size_index] for size_index in size_indexes]
+    process_page_image(text, file_name, is_arabic(text), sizes)
+
+
+@celery_app.task()
+def stamp_book_pages(book_id, pages, manifest, token=None):
+    if cache.get(RENDER_RUNNING_KEY.format(book_id)) != token:
+        # the lock expired and a newer render may have written its manifest already,
+        # render again from the current pages instead of overwriting it
+        schedule_process_book(book_id)
+        return
+
+    writer = AssetWriter()
+    all_pages = sorted(int(page) for page in manifest)
+    for size in settings.BOOK_IMAGE_SIZES:
+        writer.add(book_bundle_path(book_id, size[2]), pack_book_bundle(book_id, all_pages, size[2], pages))
+    writer.flush()
+
+    # stamps go after the bundles, clients re-download when a stamp changes
+    for page in pages:
+        stamp_book(f"books/{book_id}/{page}/stamp", writer)
+    writer.flush()
+    save_render_manifest(book_id, manifest)
+    release_render(book_id, token)
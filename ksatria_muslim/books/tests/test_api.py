@@ -0,0 +1,106 @@
+import pytest
+from django.urls import reverse
+
+from ksatria_muslim.books.models import Book, BookReference, BookState, Page
+from ksatria_muslim.children.models import Child
+
+pytestmark = pytest.mark.django_db
+
+# ATOMIC_REQUESTS adds a savepoint and its release to every request
+SAVEPOINT_QUERIES = 2
+# count + page
+BOOK_LIST_QUERIES = 2 + SAVEPOINT_QUERIES
+# book with its reference + pages last modified + pages
+BOOK_DETAIL_QUERIES = 3 + SAVEPOINT_QUERIES
+
+
+@pytest.fixture
+def book():
+    reference = BookReference.objects.create(title="Adab", author="Ihfazh")
+    book = Book.objects.create(title="Ahmad ke pasar", cover="cover_books/ahmad.png", reference=reference)
+    for page in range(1, 4):
+        Page.objects.create(book=book, page=page, text=f"halaman {page}")
+    return book
+
+
+def test_book_detail_not_modified(api_client, user, book):
+    api_client.force_authenticate(user)
+    url = reverse("api:book-detail", args=[book.id])
+
+    resp = api_client.get(url)
+    assert resp.status_code == 200
+    assert len(resp.json()["page_set"]) == 3
+    etag = resp["ETag"]
+
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+
+    Page.objects.filter(book=book, page=3).delete()
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert len(resp.json()["page_set"]) == 2
+
+
+def add_pages(book, count):
+    Page.objects.bulk_create([
+        Page(book=book, page=page, text=f"halaman {page}")
+        for page in range(100, 100 + count)
+    ])
+
+
+@pytest.mark.parametrize("page_count", [0, 30])
+def test_book_list_query_budget(api_client, user, book, page_count, django_assert_max_num_queries):
+    add_pages(book, page_count)
+    api_client.force_authenticate(user)
+
+    with django_assert_max_num_queries(BOOK_LIST_QUERIES):
+        resp = api_client.get(reverse("api:book-list"))
+    assert resp.status_code == 200
+
+
+@pytest.mark.parametrize("page_count", [0, 30])
+def test_book_detail_query_budget(api_client, user, book, page_count, django_assert_max_num_queries):
+    add_pages(book, page_count)
+    api_client.force_authenticate(user)
+
+    with django_assert_max_num_queries(BOOK_DETAIL_QUERIES):
+        resp = api_client.get(reverse("api:book-detail", args=[book.id]))
+    assert len(resp.json()["page_set"]) == 3 + page_count
+
+
+def test_book_state_locked_after_ten_readings(api_client, user, book, django_assert_max_num_queries):
+    child = Child.objects.create(name="Ahmad", parent=user)
+    api_client.force_authenticate(user)
+
+    for _ in range(10):
+        api_client.post(reverse("api:book-log", args=[book.id]), {"child_id": child.id})
+        api_client.post(reverse("api:book-finish", args=[book.id]), {"child_id": child.id})
+
+    state = BookState.objects.get(book=book, child=child)
+    assert state.finished_count == 10
+    assert state.locked
+
+    # the states only, whatever the reading history size
+    with django_assert_max_num_queries(1 + SAVEPOINT_QUERIES):
+        resp = api_client.get(reverse("api:bookstate-list"), {"child_id": child.id})
+    assert resp.json()[0]["locked"]
+
+
+def test_book_sync_replay_is_idempotent(api_client, user, book):
+    child = Child.objects.create(name="Ahmad", parent=user)
+    api_client.force_authenticate(user)
+    reading_id = "6f1c1b7e-2f6a-4a8e-9d1e-0b5c3f1a2d4e"
+    events = [
+        {"id": reading_id, "type": "start", "book_id": book.id, "child_id": child.id,
+         "timestamp": "2023-05-01T08:00:00Z"},
+        {"id": reading_id, "type": "finish", "book_id": book.id, "child_id": child.id,
+         "timestamp": "2023-05-01T08:10:00Z"},
+    ]
+
+    for finished in [1, 0]:
+        resp = api_client.post(reverse("api:book-sync"), {"events": events}, format="json")
+        assert resp.json() == {"status": "ok", "finished": finished}
+
+    state = BookState.objects.get(book=book, child=child)
+    assert state.finished_count == 1
+    assert state.last_finished_started_at.isoformat() == "2023-05-01T08:00:00+00:00"
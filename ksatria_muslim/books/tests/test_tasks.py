@@ -1,7 +1,25 @@
+import json
+import zipfile
+
 import pytest
 from celery.result import EagerResult
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 
+from config import celery_app
+from ksatria_muslim.books.models import Book, Page
+from ksatria_muslim.books.tasks import (
+    RENDER_FORCE_KEY,
+    RENDER_RUNNING_KEY,
+    process_book,
+    process_page,
+    schedule_process_book,
+    stamp_book_pages,
+)
 from ksatria_muslim.users.tasks import get_users_count
+from ksatria_muslim.utils.book_image import book_bundle_path, load_render_manifest, pack_book_bundle
+from ksatria_muslim.utils.storage import overwrite_file
 from ksatria_muslim.users.tests.factories import UserFactory
 
 pytestmark = pytest.mark.django_db
@@ -14,3 +32,103 @@ def test_user_count(settings):
     task_result = get_users_count.delay()
     assert isinstance(task_result, EagerResult)
     assert task_result.result == 3
+
+
+def write_page(book_id, page, image):
+    overwrite_file(f"books_image/books/{book_id}/{page}-hdpi.png", image)
+    overwrite_file(f"book_image_metadata/books/{book_id}/{page}-hdpi.json", json.dumps({"page_data": [page]}))
+
+
+def test_pack_book_bundle_reads_only_the_changed_pages(monkeypatch):
+    for page in (1, 2):
+        write_page(7, page, f"page {page}".encode())
+    overwrite_file(book_bundle_path(7, "hdpi"), pack_book_bundle(7, [1, 2], "hdpi"))
+
+    write_page(7, 2, b"page 2 fixed")
+    opened = []
+    storage_open = default_storage.open
+    monkeypatch.setattr(default_storage, "open", lambda name, *args: opened.append(name) or storage_open(name, *args))
+    bundle = zipfile.ZipFile(pack_book_bundle(7, [1, 2], "hdpi", [2]))
+
+    assert sorted(opened) == [
+        "book_image_metadata/books/7/2-hdpi.json",
+        "books_image/books/7/2-hdpi.png",
+        book_bundle_path(7, "hdpi"),
+    ]
+    assert bundle.read("1.png") == b"page 1"
+    assert bundle.read("2.png") == b"page 2 fixed"
+    assert [page["page_data"] for page in json.loads(bundle.read("index.json"))["pages"]] == [[1], [2]]
+
+
+def test_schedule_process_book_keeps_a_pending_force(monkeypatch):
+    cache.clear()
+    queued = []
+    monkeypatch.setattr(process_book, "apply_async", lambda args, countdown: queued.append(args))
+
+    schedule_process_book(7)
+    schedule_process_book(7, force=True)
+
+    assert queued == [(7, False)]
+    assert cache.get(RENDER_FORCE_KEY.format(7))
+
+
+def test_stamp_book_pages_leaves_a_newer_render_alone(monkeypatch):
+    cache.clear()
+    queued = []
+    monkeypatch.setattr(process_book, "apply_async", lambda args, countdown: queued.append(args))
+    cache.set(RENDER_RUNNING_KEY.format(7), "newer")
+
+    stamp_book_pages(7, [1], {"1": {"hdpi": "old"}}, "expired")
+
+    assert cache.get(RENDER_RUNNING_KEY.format(7)) == "newer"
+    assert load_render_manifest(7) == {}
+    assert queued == [(7, False)]
+
+
+@pytest.fixture
+def rendered_pages(monkeypatch):
+    """
+    run the renders eagerly, recording the (page, size indexes) dispatched to `process_page`
+    instead of drawing them
+    """
+    cache.clear()
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    rendered = []
+
+    def render(book_id, page, text, size_indexes):
+        rendered.append((page, size_indexes))
+        for size_index in size_indexes:
+            dimen_name = settings.BOOK_IMAGE_SIZES[size_index][2]
+            overwrite_file(f"books_image/books/{book_id}/{page}-{dimen_name}.png", text.encode())
+            overwrite_file(f"book_image_metadata/books/{book_id}/{page}-{dimen_name}.json", "{}")
+
+    monkeypatch.setattr(process_page, "run", render)
+    return rendered
+
+
+@pytest.fixture
+def book():
+    book = Book.objects.create(title="Kisah Nabi", cover="cover_books/cover.png")
+    for page in (1, 2, 3):
+        Page.objects.create(book=book, page=page, text=f"halaman {page}")
+    return book
+
+
+def test_process_book_renders_only_the_changed_pages(book, rendered_pages):
+    all_sizes = list(range(len(settings.BOOK_IMAGE_SIZES)))
+    process_book(book.id)
+    assert rendered_pages == [(1, all_sizes), (2, all_sizes), (3, all_sizes)]
+
+    rendered_pages.clear()
+    process_book(book.id)
+    assert rendered_pages == []
+
+    Page.objects.filter(book=book, page=2).update(text="halaman dua")
+    process_book(book.id)
+    assert rendered_pages == [(2, all_sizes)]
+    bundle = zipfile.ZipFile(default_storage.open(book_bundle_path(book.id, "hdpi")))
+    assert bundle.read("2.png") == b"halaman dua"
+
+    rendered_pages.clear()
+    process_book(book.id, force=True)
+    assert rendered_pages == [(1, all_sizes), (2, all_sizes), (3, all_sizes)]
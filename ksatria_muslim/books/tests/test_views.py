@@ -4,10 +4,15 @@ from django.contrib import messages
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
 from django.http import HttpRequest, HttpResponseRedirect
 from django.test import RequestFactory
 from django.urls import reverse
+from django.utils.functional import empty
+from rest_framework.authtoken.models import Token
 
+from ksatria_muslim.books.book_storage import book_storage, save_audio_timestamp
+from ksatria_muslim.books.models import Book
 from ksatria_muslim.users.forms import UserAdminChangeForm
 from ksatria_muslim.users.models import User
 from ksatria_muslim.users.tests.factories import UserFactory
@@ -100,3 +105,50 @@ class TestUserDetailView:
         assert isinstance(response, HttpResponseRedirect)
         assert response.status_code == 302
         assert response.url == f"{login_url}?next=/fake-url/"
+
+
+@pytest.fixture
+def audio_book(settings, tmp_path):
+    cache.clear()
+    settings.BOOK_STORAGE_MEDIA = str(tmp_path)
+    book_storage._wrapped = empty
+    book = Book.objects.create(title="Audio")
+    audio = tmp_path / str(book.id) / "audio"
+    audio.mkdir(parents=True)
+    for index in range(3):
+        (audio / f"{book.id}_1_{index}.mp3").write_bytes(bytes(range(256)) * 4)
+    save_audio_timestamp(book.id)
+    return book
+
+
+def test_book_audio_zip_resumes_with_range(client, user, audio_book):
+    url = reverse("books:audio-zip", args=[audio_book.id])
+    params = {"token": Token.objects.create(user=user).key}
+    # the first download builds and caches the archive
+    archive = b"".join(client.get(url, params).streaming_content)
+
+    resp = client.get(url, params, HTTP_RANGE="bytes=100-")
+    assert resp.status_code == 206
+    assert resp["Content-Range"] == f"bytes 100-{len(archive) - 1}/{len(archive)}"
+    assert b"".join(resp.streaming_content) == archive[100:]
+
+    # a range of an older archive is answered with the whole new one
+    resp = client.get(url, params, HTTP_RANGE="bytes=100-", HTTP_IF_RANGE='"older"')
+    assert resp.status_code == 200
+    assert b"".join(resp.streaming_content) == archive
+
+    resp = client.get(url, params, HTTP_RANGE=f"bytes={len(archive)}-")
+    assert resp.status_code == 416
+
+
+def test_book_audio_zip_limits_downloads_per_token(client, user, settings, audio_book):
+    settings.BOOK_AUDIO_DOWNLOADS_PER_TOKEN = 1
+    url = reverse("books:audio-zip", args=[audio_book.id])
+    params = {"token": Token.objects.create(user=user).key}
+
+    running = client.get(url, params)
+    assert client.get(url, params).status_code == 429
+
+    # consuming the download closes the response, which frees the slot
+    b"".join(running.streaming_content)
+    assert client.get(url, params).status_code == 200
@@ -1,17 +1,25 @@
-import zipfile
-
 import csv
 import json
+import re
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from django.core.files.storage import default_storage
-from rest_framework.authtoken.models import Token
-
-from ksatria_muslim.books.book_storage import book_storage
+from django.utils.http import quote_etag
+
+from ksatria_muslim.books.book_storage import (
+    audio_base_path,
+    audio_zip_path,
+    book_storage,
+    get_audio_timestamp,
+    stream_audio_zip,
+)
+from ksatria_muslim.books.cache import acquire_audio_download, is_valid_audio_token, release_audio_download
 from ksatria_muslim.books.forms import UploadAudioForm
 from ksatria_muslim.books.models import Book
+from ksatria_muslim.utils.book_image import page_image_extension
+from ksatria_muslim.utils.storage import read_files
 
 
 @login_required
@@ -20,35 +28,37 @@ def book_image_gallery(request, pk):
     return render(request, "books/image_gallery.html", {
         "instance": instance,
         "media_url": settings.MEDIA_URL,
-        "sizes": [size[2] for size in settings.BOOK_IMAGE_SIZES]
+        "sizes": [size[2] for size in settings.BOOK_IMAGE_SIZES],
+        "extension": page_image_extension(),
     })
 
 
+class Echo:
+    """file-like object for the csv writer, returns the line instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
 @login_required
 def book_text_page_csv(request, pk):
     instance: Book = get_object_or_404(Book, pk=pk)
-    paths = []
-    for page in instance.page_set.all():
-        fname = f"book_image_metadata/books/{pk}/{page.page}-hdpi.json"
-        paths.append((fname, page))
-
-    rows = []
-    for path, page in paths:
-        f = default_storage.open(path)
-        metadata = json.load(f)
-        for index, item in enumerate(metadata.get("page_data", [])):
-            rows.append([pk, page.page, index, item.get("text")])
-
-    response = HttpResponse(
+    pages = list(instance.page_set.values_list("page", flat=True))
+    paths = [f"book_image_metadata/books/{pk}/{page}-hdpi.json" for page in pages]
+
+    def rows():
+        writer = csv.writer(Echo())
+        yield writer.writerow(["book_id", "page_number", "index", "text"])
+        for page, metadata in zip(pages, read_files(paths, json.load)):
+            for index, item in enumerate(metadata.get("page_data", [])):
+                yield writer.writerow([pk, page, index, item.get("text")])
+
+    return StreamingHttpResponse(
+        rows(),
         content_type="text/csv",
         headers={'Content-Disposition': f'attachment; filename="{instance.title}-texts.csv"'},
     )
 
-    writer = csv.writer(response)
-    writer.writerow(["book_id", "page_number", "index", "text"])
-    writer.writerows(rows)
-    return response
-
 
 @login_required
 def upload_audio_zip(request, pk):
@@ -78,36 +88,168 @@ def book_audio_zip(request, pk):
     if not token:
         return HttpResponseForbidden()
 
-    token_found = Token.objects.filter(key=token).exists()
-    if not token_found:
+    if not is_valid_audio_token(token):
         return HttpResponseForbidden()
 
+    current_timestamp = get_audio_timestamp(pk)
+    timestamp = request.GET.get("timestamp", None)
+    if timestamp and timestamp == current_timestamp:
+        raise Http404("Audio same with in the local")
+
     instance = get_object_or_404(Book, pk=pk)
-    base_path = f"{pk}/audio/"
+    base_path = audio_base_path(pk)
     if not book_storage.exists(base_path):
         raise Http404("Audio not found.")
 
-    timestamp = request.GET.get("timestamp", None)
-    timestamp_file = f"{base_path}timestamp"
-    if timestamp:
-        # if found, check also if the given timestamp equals then
-        # raise audio not found
-        f = book_storage.open(timestamp_file, "r")
-        if timestamp == f.read().strip():
-            raise Http404("Audio same with in the local")
-        f.close()
-
-    _, files = book_storage.listdir(base_path)
-
-    response = HttpResponse(
+    # a few syncing devices must not hold every worker
+    if not acquire_audio_download(token):
+        return HttpResponse("Too many downloads", status=429)
+
+    try:
+        return audio_zip_response(request, instance, current_timestamp, lambda: release_audio_download(token))
+    except Exception:
+        release_audio_download(token)
+        raise
+
+
+class ReleaseOnCloseMixin:
+    """calls `on_close` once the server closed the response, also when the download was cut off"""
+
+    def __init__(self, *args, on_close=None, **kwargs):
+        self.on_close = on_close
+        super().__init__(*args, **kwargs)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            on_close, self.on_close = self.on_close, None
+            if on_close:
+                on_close()
+
+
+class AudioZipFileResponse(ReleaseOnCloseMixin, FileResponse):
+    pass
+
+
+class AudioZipStreamingResponse(ReleaseOnCloseMixin, StreamingHttpResponse):
+    pass
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_byte_range(header, size):
+    """
+    :param header: value of the Range header
+    :param size: file size
+    :return: (start, end) inclusive of a single byte range, None when the whole file should be sent
+    :raise ValueError: when the range can't be satisfied
+    """
+    match = RANGE_RE.match(header or "")
+    if not match:
+        # missing, multiple ranges or another unit: the whole file
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # suffix range, the last bytes of the file
+        length = int(last)
+        if not length or not size:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+class FileRange:
+    """iterates `length` bytes of the file from `start`, the file is closed with the response"""
+
+    def __init__(self, file, start, length, chunk_size=64 * 1024):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        self.file.seek(self.start)
+        remaining = self.length
+        while remaining > 0:
+            chunk = self.file.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def audio_zip_response(request, instance, timestamp, on_close):
+    file_name = f"{instance.title}-audio.zip"
+    # the archive only changes with a new upload, it is built once per timestamp
+    cache_path = audio_zip_path(instance.pk, timestamp) if timestamp else None
+    if cache_path and book_storage.exists(cache_path):
+        return cached_audio_zip_response(request, cache_path, timestamp, file_name, on_close)
+
+    _, files = book_storage.listdir(audio_base_path(instance.pk))
+    return AudioZipStreamingResponse(
+        stream_audio_zip(instance.pk, files, cache_path),
+        on_close=on_close,
         content_type="application/zip",
         headers={
-            "Content-Disposition": f"attachment; filename={instance.title}-audio.zip"
+            "Content-Disposition": f"attachment; filename={file_name}"
         }
     )
 
-    with zipfile.ZipFile(response, "w") as compressor:
-        for file in files:
-            compressor.write(book_storage.path(f"{base_path}{file}"), arcname=file)
 
-    return response
+def cached_audio_zip_response(request, cache_path, timestamp, file_name, on_close):
+    """
+    the cached archive, or the requested byte range of it so an interrupted download can resume
+    """
+    size = book_storage.size(cache_path)
+    etag = quote_etag(timestamp)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename={file_name}",
+    }
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    # a range of an archive of another upload would corrupt the resumed file
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_byte_range(request.headers.get("Range"), size)
+        except ValueError:
+            on_close()
+            return HttpResponse(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        response = AudioZipFileResponse(
+            book_storage.open(cache_path, "rb"), as_attachment=True, filename=file_name, on_close=on_close
+        )
+        response["Accept-Ranges"] = headers["Accept-Ranges"]
+        response["ETag"] = etag
+        return response
+
+    start, end = byte_range
+    return AudioZipStreamingResponse(
+        FileRange(book_storage.open(cache_path, "rb"), start, end - start + 1),
+        on_close=on_close,
+        status=206,
+        content_type="application/zip",
+        headers={
+            **headers,
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+        },
+    )
@@ -1,9 +1,8 @@
-from django.db import models
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
 from ksatria_muslim.children.models import Child, PhotoProfile
-from ksatria_muslim.rewards.models import REWARD_TYPES
+from ksatria_muslim.rewards.models import REWARD_TYPES, RewardBalance
 
 
 class PhotoProfileSerializer(ModelSerializer):
@@ -22,11 +21,16 @@ class ChildSerializer(ModelSerializer):
 
     points = serializers.SerializerMethodField()
     def get_points(self, obj):
-        return obj.rewards.filter(reward_type=REWARD_TYPES.Point).aggregate(models.Sum("count"))["count__sum"] or 0
+        # annotated by `RewardBalance.with_balances` in the viewset
+        if hasattr(obj, "points_balance"):
+            return obj.points_balance
+        return RewardBalance.get_balance(obj, REWARD_TYPES.Point)
 
     stars = serializers.SerializerMethodField()
     def get_stars(self, obj):
-        return obj.rewards.filter(reward_type=REWARD_TYPES.Star).aggregate(models.Sum("count"))["count__sum"] or 0
+        if hasattr(obj, "stars_balance"):
+            return obj.stars_balance
+        return RewardBalance.get_balance(obj, REWARD_TYPES.Star)
 
     default_package_name = serializers.SerializerMethodField()
     def get_default_package_name(self, obj):
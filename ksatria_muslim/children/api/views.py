@@ -6,6 +6,7 @@ from rest_framework.viewsets import GenericViewSet
 
 from ksatria_muslim.children.api.serializers import ChildSerializer, PhotoProfileSerializer
 from ksatria_muslim.children.models import Child, PhotoProfile
+from ksatria_muslim.rewards.models import RewardBalance
 from ksatria_muslim.utils.pagination import KsatriaMuslimPagination
 
 
@@ -14,7 +15,8 @@ class ChildViewSet(RetrieveModelMixin, ListModelMixin, UpdateModelMixin, CreateM
     queryset = Child.objects.all()
 
     def get_queryset(self):
-        return self.queryset.filter(parent=self.request.user)
+        queryset = self.queryset.filter(parent=self.request.user).select_related("picture", "default_package")
+        return RewardBalance.with_balances(queryset)
 
     @action(methods=["POST"], detail=True)
     def set_picture(self, request, pk, *args, **kwargs):
@@ -0,0 +1,51 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from ksatria_muslim.children.models import Child, PhotoProfile
+from ksatria_muslim.packages.models import Package
+from ksatria_muslim.rewards.models import REWARD_TYPES, RewardHistory
+
+pytestmark = pytest.mark.django_db
+
+# ATOMIC_REQUESTS adds a savepoint and its release to every request
+SAVEPOINT_QUERIES = 2
+# the children, with their balances, picture and default package
+CHILD_LIST_QUERIES = 1 + SAVEPOINT_QUERIES
+
+
+def add_children(parent, count):
+    picture = PhotoProfile.objects.create(photo=SimpleUploadedFile("child.png", b"png"), title="Ksatria")
+    package = Package.objects.create(title="Nonton", price=10, length=10)
+    for index in range(count):
+        child = Child.objects.create(name=f"Ahmad {index}", parent=parent, picture=picture, default_package=package)
+        RewardHistory.objects.create(child=child, count=index)
+        RewardHistory.objects.create(child=child, count=2 * index, reward_type=REWARD_TYPES.Star)
+
+
+@pytest.mark.parametrize("child_count", [1, 5])
+def test_child_list_query_budget(api_client, user, child_count, django_assert_max_num_queries):
+    add_children(user, child_count)
+    api_client.force_authenticate(user)
+
+    with django_assert_max_num_queries(CHILD_LIST_QUERIES):
+        resp = api_client.get(reverse("api:child-list"))
+
+    children = resp.json()
+    assert len(children) == child_count
+    assert [(child["points"], child["stars"]) for child in children] == [
+        (index, 2 * index) for index in range(child_count)
+    ]
+    assert all(child["default_package_name"] == "Nonton" for child in children)
+
+
+def test_child_detail_query_budget(api_client, user, django_assert_max_num_queries):
+    add_children(user, 3)
+    child = Child.objects.get(name="Ahmad 2")
+    api_client.force_authenticate(user)
+
+    with django_assert_max_num_queries(CHILD_LIST_QUERIES):
+        resp = api_client.get(reverse("api:child-detail", args=[child.id]))
+
+    assert (resp.json()["points"], resp.json()["stars"]) == (2, 4)
+    assert resp.json()["picture"]["photo"].endswith(".png")
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.safestring import mark_safe
 
+from ksatria_muslim.children_task.board import invalidate_boards
 from ksatria_muslim.children_task.models import Task, TaskHistory
 
 
@@ -35,5 +37,9 @@ class TaskHistoryAdmin(admin.ModelAdmin):
 
     @admin.action(description="Mark as done")
     def mark_as_done(self, request, qs):
+        # read before the update, a status filter would not match the rows anymore
+        child_dates = set(qs.values_list("child_id", "for_date"))
         qs.update(status=TaskHistory.STATUS.finished)
+        # updates send no post_save
+        transaction.on_commit(lambda: invalidate_boards(child_dates))
 
@@ -0,0 +1,114 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from ksatria_muslim.children_task.models import TaskHistory
+
+BOARD_KEY = "children_task:versioned-board:{}:{}"
+BOARD_VERSION_KEY = "children_task:board-version:{}:{}"
+BOARD_LOCK_KEY = "children_task:board-lock:{}:{}"
+BOARD_LOCK_TIMEOUT = 10
+# the version outlives the boards stored with it
+BOARD_VERSION_TIMEOUT_FACTOR = 2
+
+
+def board_keys(child_id, date):
+    """
+    :return: the key of the board, and the key of the version it is valid for
+    """
+    return BOARD_KEY.format(child_id, date.isoformat()), BOARD_VERSION_KEY.format(child_id, date.isoformat())
+
+
+def snapshot_task(history: TaskHistory):
+    """
+    :return: the task as shown on the board, the image url is relative
+    """
+    time = "Belum Terjadwal"
+    if history.task.scheduled_at:
+        time = history.task.scheduled_at.strftime("%H:%M")
+
+    return {
+        "id": history.id,
+        "title": history.task.title,
+        "status": history.status,
+        "image": history.task.image.url if history.task.image else "",
+        "udzur": history.udzur_reason,
+        "time": time,
+        "need_confirmation": history.task.need_verification,
+        "created": history.created
+    }
+
+
+def build_board(child_id, date):
+    histories = TaskHistory.objects.filter(
+        child_id=child_id,
+        task__active=True,
+        task__days__contains=[date.isoweekday()],
+        for_date=date,
+    ).select_related("task").order_by("task__scheduled_at", "task__title")
+    return [snapshot_task(history) for history in histories]
+
+
+def get_board(child_id, date=None):
+    """
+    :return: the task snapshots of the child for the day, today by default
+    """
+    date = date or timezone.localdate()
+    key, version_key = board_keys(child_id, date)
+    cached = cache.get_many([key, version_key])
+    version = cached.get(version_key)
+    board = cached.get(key)
+    if board is not None and board["version"] == version:
+        return board["tasks"]
+
+    tasks = build_board(child_id, date)
+    # a change committed while building sets a new version, so this copy is never served
+    cache.set(key, {"version": version, "tasks": tasks}, settings.CHILDREN_TASK_BOARD_TIMEOUT)
+    return tasks
+
+
+def invalidate_boards(child_dates):
+    """
+    :param child_dates: (child id, date) of the boards to rebuild on the next read
+    """
+    cache.set_many({
+        board_keys(child_id, date)[1]: uuid.uuid4().hex
+        for child_id, date in child_dates if date
+    }, BOARD_VERSION_TIMEOUT_FACTOR * settings.CHILDREN_TASK_BOARD_TIMEOUT)
+
+
+def update_board(history: TaskHistory):
+    """
+    replace the task of the history in its cached board.
+    The board is invalidated instead when another update holds it, or when it is missing, outdated
+    or without the task.
+    """
+    if not history.for_date:
+        return
+
+    key, version_key = board_keys(history.child_id, history.for_date)
+    lock_key = BOARD_LOCK_KEY.format(history.child_id, history.for_date.isoformat())
+    if not cache.add(lock_key, True, BOARD_LOCK_TIMEOUT):
+        invalidate_boards([(history.child_id, history.for_date)])
+        return
+
+    try:
+        cached = cache.get_many([key, version_key])
+        board = cached.get(key)
+        # a board being rebuilt from before this change is stored with the previous version
+        version = uuid.uuid4().hex
+        cache.set(version_key, version, BOARD_VERSION_TIMEOUT_FACTOR * settings.CHILDREN_TASK_BOARD_TIMEOUT)
+        if board is None or board["version"] != cached.get(version_key):
+            return
+
+        for index, item in enumerate(board["tasks"]):
+            if item["id"] == history.id:
+                board["tasks"][index] = snapshot_task(history)
+                board["version"] = version
+                cache.set(key, board, settings.CHILDREN_TASK_BOARD_TIMEOUT)
+                return
+        # the position of a new task is only known by rebuilding
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+import django.utils.timezone
+
+# todo histories have not been touched, their duplicates can go
+STATUS_PRIORITY = {"finished": 0, "pending": 1, "udzur": 2, "todo": 3}
+
+
+def backfill_for_date(apps, schema_editor):
+    TaskHistory = apps.get_model("children_task", "TaskHistory")
+    TaskHistory.objects.update(for_date=TruncDate("created"))
+
+    duplicates = (
+        TaskHistory.objects.values("task_id", "child_id", "for_date")
+        .annotate(count=models.Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        histories = sorted(
+            TaskHistory.objects.filter(
+                task_id=duplicate["task_id"], child_id=duplicate["child_id"], for_date=duplicate["for_date"]
+            ),
+            key=lambda history: (STATUS_PRIORITY.get(history.status, 3), history.created),
+        )
+        for history in histories[1:]:
+            if history.status == "todo":
+                history.delete()
+            else:
+                history.for_date = None
+                history.save(update_fields=["for_date"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('children_task', '0009_auto_20240603_2326'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskhistory',
+            name='for_date',
+            field=models.DateField(default=django.utils.timezone.localdate, null=True),
+        ),
+        migrations.RunPython(backfill_for_date, migrations.RunPython.noop),
+    ]
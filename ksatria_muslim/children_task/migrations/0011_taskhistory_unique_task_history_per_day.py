@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # separate from the backfill, postgres can't alter a table with pending trigger events
+
+    dependencies = [
+        ('children_task', '0010_taskhistory_for_date'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='taskhistory',
+            constraint=models.UniqueConstraint(fields=('task', 'child', 'for_date'), name='unique_task_history_per_day'),
+        ),
+    ]
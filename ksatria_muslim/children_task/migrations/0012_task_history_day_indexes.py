@@ -0,0 +1,35 @@
+# Generated by Django 4.1.9 on 2026-10-17 21:52
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the history table is large, don't lock it while indexing
+    atomic = False
+
+    dependencies = [
+        ("children_task", "0011_taskhistory_unique_task_history_per_day"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="task",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["days"], name="task_days_gin"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="taskhistory",
+            index=models.Index(
+                fields=["child", "for_date", "status"], name="task_history_child_day"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="taskhistory",
+            index=models.Index(
+                fields=["status", "child"], name="task_history_status_child"
+            ),
+        ),
+    ]
@@ -1,8 +1,12 @@
 import uuid
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from model_utils import Choices
 from model_utils.models import TimeStampedModel
 
@@ -21,6 +25,12 @@ class Task(TimeStampedModel):
 
     days = ArrayField(models.IntegerField(validators=[MaxValueValidator(7), MinValueValidator(1)]), default=list)
 
+    class Meta:
+        indexes = [
+            # `days__contains` of the daily lookups
+            GinIndex(fields=["days"], name="task_days_gin"),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -35,5 +45,43 @@ class TaskHistory(TimeStampedModel):
     udzur_reason = models.TextField(null=True, blank=True)
     photo = models.ImageField(upload_to="task_history/", null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
+    # the day the task is for, null only for legacy duplicates of a day
+    for_date = models.DateField(null=True, default=timezone.localdate)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["task", "child", "for_date"], name="unique_task_history_per_day"),
+        ]
+        indexes = [
+            # the board and the counts of a day
+            models.Index(fields=["child", "for_date", "status"], name="task_history_child_day"),
+            # pending tasks to review
+            models.Index(fields=["status", "child"], name="task_history_status_child"),
+        ]
+
+
+@receiver(post_save, sender=TaskHistory)
+def update_task_board(sender, instance: TaskHistory, created, **kwargs):
+    from ksatria_muslim.children_task.board import invalidate_boards, update_board
+
+    if created:
+        transaction.on_commit(lambda: invalidate_boards([(instance.child_id, instance.for_date)]))
+    else:
+        transaction.on_commit(lambda: update_board(instance))
+
+
+@receiver(post_delete, sender=TaskHistory)
+def invalidate_deleted_task_board(sender, instance: TaskHistory, **kwargs):
+    from ksatria_muslim.children_task.board import invalidate_boards
+
+    transaction.on_commit(lambda: invalidate_boards([(instance.child_id, instance.for_date)]))
+
 
+@receiver(post_save, sender=Task)
+def invalidate_task_boards(sender, instance: Task, **kwargs):
+    from ksatria_muslim.children_task.board import invalidate_boards
 
+    # title, schedule or days of the task changed on the boards of its children
+    today = timezone.localdate()
+    child_ids = list(instance.children.values_list("id", flat=True))
+    transaction.on_commit(lambda: invalidate_boards([(child_id, today) for child_id in child_ids]))
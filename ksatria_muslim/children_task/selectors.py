@@ -1,3 +1,4 @@
+from django.db import models
 from django.utils import timezone
 
 from ksatria_muslim.children_task.models import Task, TaskHistory
@@ -5,9 +6,37 @@ from ksatria_muslim.children_task.models import Task, TaskHistory
 
 def get_children_tasks(child_id) -> list[TaskHistory]:
     tasks = Task.objects.filter(children__id=child_id, active=True)
-    today = timezone.now().today()
+    today = timezone.localdate()
     today_histories = [
-        TaskHistory.objects.get_or_create(created__date=today, task_id=task.id, child_id=child_id)
+        TaskHistory.objects.get_or_create(for_date=today, task_id=task.id, child_id=child_id)
         for task in tasks
     ]
     return [instance for instance, created in today_histories]
+
+
+def with_task_counts(children, date=None):
+    """
+    annotate the children with the count of each status of their tasks of the day,
+    counted for all of them in the same query
+
+    :param children: Child queryset
+    :param date: today by default
+    :return: the queryset with `todo_count`, `pending_count`, `udzur_count`, `finished_count` and `task_count`
+    """
+    date = date or timezone.localdate()
+    day = models.Q(
+        taskhistory__for_date=date,
+        taskhistory__task__active=True,
+        taskhistory__task__days__contains=[date.isoweekday()],
+    )
+
+    def count(status):
+        return models.Count("taskhistory", filter=day & models.Q(taskhistory__status=status))
+
+    return children.annotate(
+        todo_count=count(TaskHistory.STATUS.todo),
+        pending_count=count(TaskHistory.STATUS.pending),
+        udzur_count=count(TaskHistory.STATUS.udzur),
+        finished_count=count(TaskHistory.STATUS.finished),
+        task_count=models.Count("taskhistory", filter=day),
+    )
@@ -1,27 +1,41 @@
+import datetime
+
 from django.utils import timezone
 
 from config.celery_app import app
+from ksatria_muslim.children_task.board import invalidate_boards
 from ksatria_muslim.children_task.models import Task, TaskHistory
 
 
 @app.task
-def generate_children_tasks():
-    """Should be generated for today"""
-    today = timezone.localtime()
-    base_tasks = Task.objects.filter(
-        days__contains=[today.isoweekday()],
-        active=True,
-    )
+def generate_children_tasks(start=None, end=None):
+    """
+    Should be generated for today, or for every day from `start` to `end` (iso dates, inclusive)
+    to backfill. Histories that already exist are left as they are, so re-runs are safe.
+    """
+    today = timezone.localdate()
+    start = datetime.date.fromisoformat(start) if start else today
+    end = datetime.date.fromisoformat(end) if end else start
 
+    # the (task, child) pairs of a weekday, straight from the m2m table
+    weekday_children = {}
     histories = []
-    for task in base_tasks:
-        for child in task.children.all():
-            history = TaskHistory(
-                task=task,
-                child=child,
+    for offset in range((end - start).days + 1):
+        date = start + datetime.timedelta(days=offset)
+        weekday = date.isoweekday()
+        if weekday not in weekday_children:
+            weekday_children[weekday] = list(
+                Task.children.through.objects.filter(
+                    task__days__contains=[weekday],
+                    task__active=True,
+                ).values_list("task_id", "child_id")
             )
-            histories.append(history)
-
-    TaskHistory.objects.bulk_create(histories)
 
+        histories.extend(
+            TaskHistory(task_id=task_id, child_id=child_id, for_date=date)
+            for task_id, child_id in weekday_children[weekday]
+        )
 
+    TaskHistory.objects.bulk_create(histories, batch_size=1000, ignore_conflicts=True)
+    # bulk inserts send no post_save
+    invalidate_boards({(history.child_id, history.for_date) for history in histories})
@@ -0,0 +1,55 @@
+import pytest
+from django.contrib import admin
+from django.core.cache import cache
+from django.utils import timezone
+
+from ksatria_muslim.children.models import Child
+from ksatria_muslim.children_task import board
+from ksatria_muslim.children_task.admin import TaskHistoryAdmin
+from ksatria_muslim.children_task.models import Task, TaskHistory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def history(user):
+    child = Child.objects.create(name="Ahmad", parent=user)
+    task = Task.objects.create(title="Sholat Subuh", days=[timezone.localdate().isoweekday()])
+    task.children.add(child)
+    return TaskHistory.objects.create(task=task, child=child)
+
+
+def statuses(child_id):
+    return [task["status"] for task in board.get_board(child_id)]
+
+
+def test_rebuild_racing_an_update_is_not_served(history, monkeypatch):
+    build_board = board.build_board
+
+    def build_then_finish(child_id, date):
+        tasks = build_board(child_id, date)
+        # committed while the board is being built
+        history.status = TaskHistory.STATUS.finished
+        history.save()
+        board.update_board(history)
+        return tasks
+
+    monkeypatch.setattr(board, "build_board", build_then_finish)
+    assert statuses(history.child_id) == [TaskHistory.STATUS.todo]
+
+    monkeypatch.setattr(board, "build_board", build_board)
+    assert statuses(history.child_id) == [TaskHistory.STATUS.finished]
+
+
+def test_mark_as_done_invalidates_the_board(history, django_capture_on_commit_callbacks):
+    assert statuses(history.child_id) == [TaskHistory.STATUS.todo]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        TaskHistoryAdmin(TaskHistory, admin.site).mark_as_done(None, TaskHistory.objects.filter(status="todo"))
+
+    assert statuses(history.child_id) == [TaskHistory.STATUS.finished]
@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+
+from ksatria_muslim.children.models import Child
+from ksatria_muslim.children_task.models import Task, TaskHistory
+from ksatria_muslim.children_task.tasks import generate_children_tasks
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def child(user):
+    return Child.objects.create(name="Ahmad", parent=user)
+
+
+def add_task(child, days, **kwargs):
+    task = Task.objects.create(title="Sholat Subuh", days=days, **kwargs)
+    task.children.add(child)
+    return task
+
+
+def test_generate_children_tasks_twice_for_a_day(child):
+    date = datetime.date(2024, 1, 1)
+    add_task(child, [date.isoweekday()])
+
+    generate_children_tasks(date.isoformat())
+    generate_children_tasks(date.isoformat())
+
+    assert list(TaskHistory.objects.values_list("child_id", "for_date")) == [(child.id, date)]
+
+
+def test_generate_children_tasks_for_a_range(child):
+    # monday and wednesday, 2024-01-01 is a monday
+    task = add_task(child, [1, 3])
+    add_task(child, [1, 3], active=False)
+
+    generate_children_tasks("2024-01-01", "2024-01-07")
+
+    assert sorted(TaskHistory.objects.values_list("task_id", "for_date")) == [
+        (task.id, datetime.date(2024, 1, 1)),
+        (task.id, datetime.date(2024, 1, 3)),
+    ]
@@ -1,4 +1,3 @@
-from django.db import models
 from django.utils import timezone
 from rest_framework import serializers, status
 from rest_framework.decorators import api_view
@@ -6,8 +5,9 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
 from ksatria_muslim.children.models import Child
+from ksatria_muslim.children_task.board import get_board, snapshot_task
 from ksatria_muslim.children_task.models import TaskHistory
-from ksatria_muslim.children_task.selectors import get_children_tasks
+from ksatria_muslim.children_task.selectors import with_task_counts
 
 
 #############################
@@ -34,51 +34,28 @@ class ChildSerializer(serializers.ModelSerializer):
         return url
 
     def get_progress(self, obj: Child):
-        # tasks = get_children_tasks(obj.id)
-        today = timezone.localdate()
-        tasks = TaskHistory.objects.filter(
-            child_id=obj.id,
-            task__active=True,
-            task__days__contains=[today.isoweekday()],
-            created__date=today
-        ).order_by("task__scheduled_at", "task__title")
-        if not tasks:
+        # counted by `with_task_counts`
+        if not obj.task_count:
             return 0.0
 
-        finished_task = [task for task in tasks if task.status in [TaskHistory.STATUS.finished, TaskHistory.STATUS.udzur]]
-        return len(finished_task) / len(tasks)
-
+        return (obj.finished_count + obj.udzur_count) / obj.task_count
 
 
 @api_view(["GET"])
 def get_children(request):
-    children = Child.objects.filter(parent=request.user)
+    children = with_task_counts(Child.objects.filter(parent=request.user).select_related("picture"))
     serializer = ChildSerializer(children, many=True, context={"request": request})
     return Response({"profiles": serializer.data})
 
 
-def serialize_task(history: TaskHistory, request=None):
+def absolute_task(task, request=None):
+    if task["image"] and request:
+        return {**task, "image": request.build_absolute_uri(task["image"])}
+    return task
 
-    image_url = ""
-    if history.task.image:
-        image_url = history.task.image.url
-        if request:
-            image_url = request.build_absolute_uri(image_url)
-
-    time = "Belum Terjadwal"
-    if history.task.scheduled_at:
-        time =  history.task.scheduled_at.strftime("%H:%M")
-
-    return {
-        "id": history.id,
-        "title": history.task.title,
-        "status": history.status,
-        "image": image_url,
-        "udzur": history.udzur_reason,
-        "time": time,
-        "need_confirmation": history.task.need_verification,
-        "created": history.created
-    }
+
+def serialize_task(history: TaskHistory, request=None):
+    return absolute_task(snapshot_task(history), request)
 
 
 @api_view(["GET"])
@@ -86,14 +63,7 @@ def get_task_list(request, child_id):
     """
     Used in the children and parent detail
     """
-    today = timezone.localdate()
-    tasks = TaskHistory.objects.filter(
-        child_id=child_id,
-        task__active=True,
-        task__days__contains=[today.isoweekday()],
-        created__date=today
-    ).order_by("task__scheduled_at", "task__title")
-    return Response({"tasks": [serialize_task(task, request) for task in tasks]})
+    return Response({"tasks": [absolute_task(task, request) for task in get_board(child_id)]})
 
 
 @api_view(["POST"])
@@ -156,20 +126,9 @@ def today_parent_dashboard(request):
         child__parent=request.user
     ).count()
 
-    # to optimize: mungkin bisa di check mana yang lebih cepat ->
-    # get data dari tasks kemudian dihitung
-    # atau get data dari anak dengan aggregate
-    children = Child.objects.filter(parent=request.user).order_by("name").annotate(
-        todo_count=models.Count("taskhistory", filter=models.Q(taskhistory__status=TaskHistory.STATUS.todo,
-                                                               taskhistory__created__date=today)),
-        pending_count=models.Count("taskhistory",
-                                filter=models.Q(taskhistory__status=TaskHistory.STATUS.pending, taskhistory__created__date=today)),
-        udzur_count=models.Count("taskhistory",
-                                   filter=models.Q(taskhistory__status=TaskHistory.STATUS.udzur,
-                                                   taskhistory__created__date=today)),
-        finished_count=models.Count("taskhistory",
-                                 filter=models.Q(taskhistory__status=TaskHistory.STATUS.finished,
-                                                 taskhistory__created__date=today)),
+    children = with_task_counts(
+        Child.objects.filter(parent=request.user).select_related("picture").order_by("name"),
+        today,
     )
 
     serialized_children = [
@@ -22,6 +22,7 @@ class ChildPackageUsageInline(TabularInline):
 class ChildPackageAdmin(ModelAdmin):
     list_display = ["child", "package", "usage", "is_exhausted"]
     inlines = [ChildPackageUsageInline]
+    list_select_related = ["child", "package"]
 
     @admin.display(description="Child")
     def child(self, obj):
@@ -33,7 +34,4 @@ class ChildPackageAdmin(ModelAdmin):
 
     @admin.display(description="Usage")
     def usage(self, obj):
-        usages = obj.usages.all()
-        if not usages:
-            return 0
-        return sum([usage.duration for usage in usages]) / 60
+        return obj.consumed_seconds / 60
@@ -32,3 +32,19 @@ class PackageLogUsageSerializer(serializers.Serializer):
 class BuyPackageBodySerializer(serializers.Serializer):
     child = serializers.PrimaryKeyRelatedField(queryset=Child.objects.all())
     package = PackageSerializer(queryset=Package.objects.all())
+
+
+class UsageIntervalSerializer(serializers.Serializer):
+    started_at = serializers.DateTimeField(input_formats=["%Y%m%d%H%M%S"])
+    finished_at = serializers.DateTimeField(input_formats=["%Y%m%d%H%M%S"])
+
+    def validate(self, attrs):
+        if attrs["finished_at"] < attrs["started_at"]:
+            raise serializers.ValidationError("finished_at is before started_at")
+        return attrs
+
+
+class PackageUsageSyncSerializer(serializers.Serializer):
+    child = serializers.PrimaryKeyRelatedField(queryset=Child.objects.all())
+    package = PackageSerializer(queryset=Package.objects.all())
+    intervals = UsageIntervalSerializer(many=True)
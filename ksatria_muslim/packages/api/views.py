@@ -1,8 +1,9 @@
+from django.db import transaction
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from ksatria_muslim.packages.api.serializers import PackageLogUsageSerializer
+from ksatria_muslim.packages.api.serializers import PackageLogUsageSerializer, PackageUsageSyncSerializer
 from ksatria_muslim.packages.models import PackageUsage, ChildPackage
 
 
@@ -39,12 +40,41 @@ class PackageUsageViewSet(GenericViewSet):
                 finished_at__isnull=True
             ).first()
             if log:
-                log.finished_at = finished_at
-                log.save()
+                log.close(finished_at)
 
-            child_package.refresh_from_db()
+            child_package.refresh_from_db(fields=["consumed_seconds"])
             if child_package.remaining <= 0.0:
                 child_package.is_exhausted = True
-                child_package.save()
+                child_package.save(update_fields=["is_exhausted", "modified"])
 
         return Response({"ok": True})
+
+    @action(methods=["POST"], detail=False)
+    def sync(self, request):
+        """
+        Store the usage intervals buffered by a device in one request,
+        instead of a `log` request for each start and finish.
+        """
+        serializer = PackageUsageSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            child_package = ChildPackage.objects.select_for_update(of=("self",)).select_related("package").filter(
+                child=serializer.validated_data["child"],
+                package=serializer.validated_data["package"],
+                is_exhausted=False
+            ).first()
+            if not child_package:
+                return Response({"ok": False, "message": "no_package"})
+
+            synced = child_package.sync_usages([
+                (interval["started_at"], interval["finished_at"])
+                for interval in serializer.validated_data["intervals"]
+            ])
+
+        return Response({
+            "ok": True,
+            "synced": synced,
+            "duration_remaining": child_package.remaining,
+            "is_exhausted": child_package.is_exhausted,
+        })
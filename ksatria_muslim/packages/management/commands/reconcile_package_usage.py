@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from ksatria_muslim.packages.models import ChildPackage
+
+
+class Command(BaseCommand):
+    help = "Check the consumed seconds of the packages against the sum of their closed usages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="store the summed usage where it differs")
+
+    def handle(self, *args, **options):
+        closed = models.Q(usages__started_at__isnull=False, usages__finished_at__isnull=False)
+        packages = ChildPackage.objects.annotate(
+            total=models.Sum(
+                models.ExpressionWrapper(
+                    models.F("usages__finished_at") - models.F("usages__started_at"), models.DurationField()
+                ),
+                filter=closed,
+            )
+        ).order_by("id")
+
+        mismatches = 0
+        for package in packages:
+            total = package.total.total_seconds() if package.total else 0
+            # the counter is a float, ignore rounding noise
+            if abs(package.consumed_seconds - total) < 0.001:
+                continue
+
+            mismatches += 1
+            self.stdout.write(f"package {package.id}: consumed {package.consumed_seconds}, usages {total}")
+            if options["fix"]:
+                package.recompute_consumed_seconds()
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All packages match their usages"))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {mismatches} packages"))
+        else:
+            self.stdout.write(self.style.ERROR(f"{mismatches} packages differ, run with --fix to repair"))
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.9 on 2026-10-17 21:55
+
+from django.db import migrations, models
+
+
+def backfill_consumed_seconds(apps, schema_editor):
+    ChildPackage = apps.get_model("packages", "ChildPackage")
+    consumed = list(ChildPackage.objects.annotate(
+        consumed=models.Sum(
+            models.ExpressionWrapper(
+                models.F("usages__finished_at") - models.F("usages__started_at"),
+                output_field=models.DurationField(),
+            )
+        )
+    ).filter(consumed__isnull=False))
+    for child_package in consumed:
+        child_package.consumed_seconds = child_package.consumed.total_seconds()
+    ChildPackage.objects.bulk_update(consumed, ["consumed_seconds"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("packages", "0002_alter_packageusage_started_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="childpackage",
+            name="consumed_seconds",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="packageusage",
+            index=models.Index(
+                condition=models.Q(("finished_at__isnull", True)),
+                fields=["child_package"],
+                name="package_usage_open",
+            ),
+        ),
+        migrations.RunPython(backfill_consumed_seconds, migrations.RunPython.noop),
+    ]
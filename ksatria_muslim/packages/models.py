@@ -1,9 +1,25 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from model_utils.models import TimeStampedModel
 
 from ksatria_muslim.children.models import Child
 
 
+def merge_intervals(intervals):
+    """
+    :param intervals: (started_at, finished_at) pairs
+    :return: sorted pairs, the overlapping or touching ones merged
+    """
+    merged = []
+    for started_at, finished_at in sorted(intervals):
+        if merged and started_at <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], finished_at))
+        else:
+            merged.append((started_at, finished_at))
+    return merged
+
+
 class Package(TimeStampedModel):
     title = models.CharField(max_length=255, unique=True)
     price = models.PositiveIntegerField()
@@ -18,6 +34,8 @@ class ChildPackage(TimeStampedModel):
     package = models.ForeignKey(Package, on_delete=models.CASCADE, related_name="children")
     child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name="purchased_packages")
     is_exhausted = models.BooleanField(default=False)
+    # sum of the duration of the closed usages, kept by `PackageUsage.close` and the PackageUsage signals
+    consumed_seconds = models.FloatField(default=0)
 
     def __str__(self):
         return f"{self.child_id} - {self.package_id}"
@@ -25,12 +43,80 @@ class ChildPackage(TimeStampedModel):
     @property
     def remaining(self):
         # total usage in seconds, and package length in minutes
-        usages = self.usages.all()
-        if not usages:
+        if not self.consumed_seconds:
             return self.package.length
 
-        usage_duration = sum([usage.duration for usage in usages]) / 60
-        return self.package.length - usage_duration
+        return self.package.length - self.consumed_seconds / 60
+
+    def add_consumed_seconds(self, seconds):
+        ChildPackage.objects.filter(pk=self.pk).update(consumed_seconds=models.F("consumed_seconds") + seconds)
+
+    def recompute_consumed_seconds(self):
+        """
+        :return: the consumed seconds summed from all the closed usages, stored in the package
+        """
+        total = self.usages.filter(started_at__isnull=False, finished_at__isnull=False).aggregate(
+            total=models.Sum(
+                models.ExpressionWrapper(models.F("finished_at") - models.F("started_at"), models.DurationField())
+            )
+        )["total"]
+        self.consumed_seconds = total.total_seconds() if total else 0
+        self.is_exhausted = self.remaining <= 0.0
+        self.save(update_fields=["consumed_seconds", "is_exhausted", "modified"])
+        return self.consumed_seconds
+
+    def sync_usages(self, intervals):
+        """
+        merge the usage intervals buffered by a device with the usages they overlap.
+        Replayed intervals are not counted twice, an open usage starting inside an interval is closed by it
+        and the usages no interval overlaps are kept. Call it with the package row locked.
+
+        :param intervals: (started_at, finished_at) pairs
+        :return: count of the stored usages replacing the overlapped ones
+        """
+        intervals = merge_intervals(intervals)
+        if not intervals:
+            return 0
+
+        overlapping = models.Q(finished_at__gte=intervals[0][0])
+        opened = models.Q(finished_at__isnull=True, started_at__gte=intervals[0][0])
+        existing = list(self.usages.filter(started_at__lte=intervals[-1][1]).filter(overlapping | opened).values_list(
+            "id", "started_at", "finished_at"
+        ))
+        closed = [(started_at, finished_at) for _, started_at, finished_at in existing if finished_at]
+
+        stale, merged = [], []
+        for block_start, block_end in merge_intervals(closed + intervals):
+            if not any(block_start <= started_at <= block_end for started_at, _ in intervals):
+                # no interval in it, the usages are left as they are
+                continue
+            inside = [
+                (usage_id, started_at, finished_at)
+                for usage_id, started_at, finished_at in existing
+                if block_start <= started_at <= block_end and (not finished_at or finished_at <= block_end)
+            ]
+            if [(started_at, finished_at) for _, started_at, finished_at in inside] == [(block_start, block_end)]:
+                # already stored, the intervals in it add nothing
+                continue
+            stale += [usage_id for usage_id, _, _ in inside]
+            merged.append((block_start, block_end))
+
+        if not merged:
+            return 0
+
+        # their post_delete takes their durations off the counter
+        self.usages.filter(id__in=stale).delete()
+        PackageUsage.objects.bulk_create([
+            PackageUsage(child_package=self, started_at=started_at, finished_at=finished_at)
+            for started_at, finished_at in merged
+        ])
+        self.add_consumed_seconds(sum(
+            (finished_at - started_at).total_seconds() for started_at, finished_at in merged
+        ))
+        self.refresh_from_db(fields=["consumed_seconds"])
+        self.is_exhausted = self.remaining <= 0.0
+        self.save(update_fields=["consumed_seconds", "is_exhausted", "modified"])
+        return len(merged)
 
 
 class PackageUsage(TimeStampedModel):
@@ -38,11 +124,53 @@ class PackageUsage(TimeStampedModel):
     started_at = models.DateTimeField(null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # the open usage of a package, looked up on every finish event
+            models.Index(
+                fields=["child_package"],
+                condition=models.Q(finished_at__isnull=True),
+                name="package_usage_open",
+            ),
+        ]
+
+    def close(self, finished_at):
+        """
+        finish the usage and add its duration to the package, once even when closed concurrently
+
+        :return: False when the usage was already closed
+        """
+        with transaction.atomic():
+            closed = PackageUsage.objects.filter(pk=self.pk, finished_at__isnull=True).update(
+                finished_at=finished_at
+            )
+            if not closed:
+                return False
+
+            self.finished_at = finished_at
+            ChildPackage(pk=self.child_package_id).add_consumed_seconds(self.duration)
+            return True
+
     @property
     def duration(self):
-        if not self.finished_at:
+        if not self.started_at or not self.finished_at:
             return 0
         return (self.finished_at - self.started_at).total_seconds()
 
     def __str__(self):
         return f"{self.duration} - {self.child_package_id}"
+
+
+@receiver(post_save, sender=PackageUsage)
+def update_consumed_seconds(sender, instance: PackageUsage, created, **kwargs):
+    if created:
+        ChildPackage(pk=instance.child_package_id).add_consumed_seconds(instance.duration)
+    else:
+        # changed outside of `close`, the previous duration is unknown
+        ChildPackage.objects.get(pk=instance.child_package_id).recompute_consumed_seconds()
+
+
+@receiver(post_delete, sender=PackageUsage)
+def revert_consumed_seconds(sender, instance: PackageUsage, **kwargs):
+    # also sent by the cascade of a deleted package, the update then matches no row
+    ChildPackage(pk=instance.child_package_id).add_consumed_seconds(-instance.duration)
@@ -0,0 +1,87 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from ksatria_muslim.children.models import Child
+from ksatria_muslim.packages.models import ChildPackage, Package, PackageUsage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def child_package(user):
+    child = Child.objects.create(name="Ahmad", parent=user)
+    package = Package.objects.create(title="Nonton", price=10, length=10)
+    return ChildPackage.objects.create(package=package, child=child)
+
+
+def add_usage(child_package, minutes):
+    started_at = timezone.now()
+    return PackageUsage.objects.create(
+        child_package=child_package, started_at=started_at, finished_at=started_at + timedelta(minutes=minutes)
+    )
+
+
+def test_usage_changes_update_consumed_seconds(child_package):
+    usage = add_usage(child_package, 2)
+    add_usage(child_package, 3)
+    child_package.refresh_from_db()
+    assert child_package.consumed_seconds == 300
+
+    usage.finished_at = usage.started_at + timedelta(minutes=1)
+    usage.save()
+    child_package.refresh_from_db()
+    assert child_package.consumed_seconds == 240
+
+    usage.delete()
+    child_package.refresh_from_db()
+    assert child_package.consumed_seconds == 180
+
+
+def test_reconcile_package_usage(child_package):
+    add_usage(child_package, 3)
+    # drift the counter without going through the signals
+    ChildPackage.objects.filter(pk=child_package.pk).update(consumed_seconds=0)
+
+    out = StringIO()
+    call_command("reconcile_package_usage", stdout=out)
+    assert f"package {child_package.id}: consumed 0.0, usages 180.0" in out.getvalue()
+
+    call_command("reconcile_package_usage", "--fix", stdout=StringIO())
+    child_package.refresh_from_db()
+    assert child_package.consumed_seconds == 180
+
+    out = StringIO()
+    call_command("reconcile_package_usage", stdout=out)
+    assert "All packages match their usages" in out.getvalue()
+
+
+def test_sync_usages_replaces_only_the_overlapped_usages(child_package):
+    now = timezone.now()
+    kept = PackageUsage.objects.create(
+        child_package=child_package, started_at=now, finished_at=now + timedelta(minutes=1)
+    )
+    overlapped = PackageUsage.objects.create(
+        child_package=child_package, started_at=now + timedelta(minutes=5), finished_at=now + timedelta(minutes=6)
+    )
+    opened = PackageUsage.objects.create(child_package=child_package, started_at=now + timedelta(minutes=11))
+
+    synced = child_package.sync_usages([
+        (now + timedelta(minutes=2), now + timedelta(minutes=3)),
+        (now + timedelta(minutes=5), now + timedelta(minutes=7)),
+        (now + timedelta(minutes=10), now + timedelta(minutes=12)),
+    ])
+
+    assert synced == 3
+    assert PackageUsage.objects.filter(pk=kept.pk).exists()
+    assert not PackageUsage.objects.filter(pk__in=[overlapped.pk, opened.pk]).exists()
+    assert not child_package.usages.filter(finished_at__isnull=True).exists()
+    assert child_package.consumed_seconds == 6 * 60
+
+    # replaying the same intervals changes nothing
+    assert child_package.sync_usages([(now + timedelta(minutes=5), now + timedelta(minutes=6))]) == 0
+    child_package.refresh_from_db()
+    assert child_package.consumed_seconds == 6 * 60
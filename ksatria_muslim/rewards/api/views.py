@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework.mixins import CreateModelMixin
@@ -8,7 +8,7 @@ from rest_framework.viewsets import GenericViewSet
 from ksatria_muslim.children.models import Child
 from ksatria_muslim.packages.api.serializers import BuyPackageBodySerializer
 from ksatria_muslim.packages.models import ChildPackage
-from ksatria_muslim.rewards.models import RewardHistory, REWARD_TYPES
+from ksatria_muslim.rewards.models import RewardBalance, RewardHistory
 
 
 class RewardHistorySerializer(serializers.ModelSerializer):
@@ -40,20 +40,16 @@ class RewardHistoryViewSet(CreateModelMixin, GenericViewSet):
         if serializer.validated_data["child_id"].parent != request.user:
             return Response({"permissible": False, "message": "not_parent"})
 
-        rewards = RewardHistory.objects.filter(
-            child=serializer.validated_data["child_id"],
-            reward_type=REWARD_TYPES.Point
-        )
-        current_rewards = rewards.aggregate(current=models.Sum("count"))["current"] or 0
-
-        if current_rewards < abs(serializer.validated_data["count"]):
-            return Response({"permissible": False, "message": "no_coin"})
+        with transaction.atomic():
+            balance = RewardBalance.lock(serializer.validated_data["child_id"])
+            if balance.balance < abs(serializer.validated_data["count"]):
+                return Response({"permissible": False, "message": "no_coin"})
 
-        RewardHistory.objects.create(
-            child=serializer.validated_data["child_id"],
-            count=serializer.validated_data["count"],
-            description=serializer.validated_data["message"]
-        )
+            RewardHistory.objects.create(
+                child=serializer.validated_data["child_id"],
+                count=serializer.validated_data["count"],
+                description=serializer.validated_data["message"]
+            )
 
         return Response({"permissible": True, "message": "can_access"})
 
@@ -68,50 +64,40 @@ class RewardHistoryViewSet(CreateModelMixin, GenericViewSet):
         if child.parent != request.user:
             return Response({"permissible": False, "message": "not_parent"})
 
-        current_rewards = self._get_current_reward(child)
+        with transaction.atomic():
+            balance = RewardBalance.lock(child)
+            current_rewards = balance.balance
 
-        child_package = ChildPackage.objects.filter(
-            child=child,
-            package=package,
-            is_exhausted=False
-        ).first()
-
-        if not child_package and current_rewards < package.price:
-            return Response({
-                "permissible": False,
-                "coin_remaining": current_rewards,
-                "duration_remaining": 0,
-                "message": "no_coin"
-            })
-
-        if not child_package and current_rewards >= package.price:
-            # pembelian
-            RewardHistory.objects.create(
+            child_package = ChildPackage.objects.filter(
                 child=child,
-                count=-package.price,
-                description=f"Buy Package {package.title}"
-            )
-
-            # package
-            child_package = ChildPackage.objects.create(
-                child=child,
-                package=package
-            )
+                package=package,
+                is_exhausted=False
+            ).first()
+
+            if not child_package and current_rewards < package.price:
+                return Response({
+                    "permissible": False,
+                    "coin_remaining": current_rewards,
+                    "duration_remaining": 0,
+                    "message": "no_coin"
+                })
+
+            if not child_package and current_rewards >= package.price:
+                # pembelian
+                RewardHistory.objects.create(
+                    child=child,
+                    count=-package.price,
+                    description=f"Buy Package {package.title}"
+                )
+                current_rewards -= package.price
+
+                # package
+                child_package = ChildPackage.objects.create(
+                    child=child,
+                    package=package
+                )
 
         remaining = child_package.remaining
-        coin = self._get_current_reward(child)
         return Response(
-            {"permissible": True, "duration_remaining": remaining, "coin_remaining": coin}
-        )
-
-    @staticmethod
-    def _get_current_reward(child):
-        rewards = RewardHistory.objects.filter(
-            child=child,
-            reward_type=REWARD_TYPES.Point
+            {"permissible": True, "duration_remaining": remaining, "coin_remaining": current_rewards}
         )
-        current_rewards = rewards.aggregate(current=models.Sum("count"))["current"] or 0
-        return current_rewards
-
-
-
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from ksatria_muslim.rewards.models import RewardBalance, RewardHistory
+
+
+class Command(BaseCommand):
+    help = "Check the reward balances against the sum of the reward history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="store the summed balance where it differs")
+
+    def handle(self, *args, **options):
+        totals = {
+            (total["child_id"], total["reward_type"]): total["total"]
+            for total in RewardHistory.objects.values("child_id", "reward_type").annotate(total=models.Sum("count"))
+        }
+        rows = RewardBalance.objects.values_list("child_id", "reward_type", "balance")
+        balances = {(child_id, reward_type): balance for child_id, reward_type, balance in rows}
+
+        mismatches = [
+            (key, balances.get(key, 0), totals.get(key, 0))
+            for key in totals.keys() | balances.keys()
+            if balances.get(key, 0) != totals.get(key, 0)
+        ]
+        for (child_id, reward_type), balance, total in sorted(mismatches):
+            self.stdout.write(f"child {child_id} {reward_type}: balance {balance}, history {total}")
+            if options["fix"]:
+                RewardBalance.recompute(child_id, reward_type)
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All reward balances match the history"))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatches)} reward balances"))
+        else:
+            self.stdout.write(self.style.ERROR(f"{len(mismatches)} reward balances differ, run with --fix to repair"))
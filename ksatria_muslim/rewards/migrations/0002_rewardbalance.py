@@ -0,0 +1,82 @@
+# Generated by Django 4.1.9 on 2026-10-17 21:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+def backfill_reward_balances(apps, schema_editor):
+    RewardHistory = apps.get_model("rewards", "RewardHistory")
+    RewardBalance = apps.get_model("rewards", "RewardBalance")
+    totals = RewardHistory.objects.values("child_id", "reward_type").annotate(total=models.Sum("count"))
+    RewardBalance.objects.bulk_create(
+        [
+            RewardBalance(child_id=total["child_id"], reward_type=total["reward_type"], balance=total["total"])
+            for total in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("children", "0003_child_default_package"),
+        ("rewards", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RewardBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="modified",
+                    ),
+                ),
+                (
+                    "reward_type",
+                    models.CharField(
+                        choices=[("Point", "Point"), ("Star", "Star")], max_length=255
+                    ),
+                ),
+                ("balance", models.IntegerField(default=0)),
+                (
+                    "child",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reward_balances",
+                        to="children.child",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="rewardbalance",
+            constraint=models.UniqueConstraint(
+                fields=("child", "reward_type"), name="unique_reward_balance"
+            ),
+        ),
+        migrations.RunPython(backfill_reward_balances, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from model_utils import choices
 from model_utils.models import TimeStampedModel
 
@@ -16,3 +19,87 @@ class RewardHistory(TimeStampedModel):
     description = models.TextField(null=True, blank=True)
     count = models.IntegerField(default=0)
     child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name="rewards")
+
+
+class RewardBalance(TimeStampedModel):
+    """
+    running sum of the reward history of a child for one reward type,
+    kept by the RewardHistory signals in the same transaction as the history
+    """
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name="reward_balances")
+    reward_type = models.CharField(max_length=255, choices=REWARD_TYPES)
+    balance = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["child", "reward_type"], name="unique_reward_balance"),
+        ]
+
+    def __str__(self):
+        return f"{self.child_id} - {self.reward_type}: {self.balance}"
+
+    @classmethod
+    def get_balance(cls, child, reward_type=REWARD_TYPES.Point):
+        return cls.objects.filter(child=child, reward_type=reward_type).values_list("balance", flat=True).first() or 0
+
+    @classmethod
+    def with_balances(cls, children):
+        """
+        annotate a Child queryset with `points_balance` and `stars_balance`, for all children in one query
+        """
+        def balance(reward_type):
+            return Coalesce(
+                models.Sum("reward_balances__balance", filter=models.Q(reward_balances__reward_type=reward_type)),
+                0,
+            )
+
+        return children.annotate(points_balance=balance(REWARD_TYPES.Point), stars_balance=balance(REWARD_TYPES.Star))
+
+    @classmethod
+    def lock(cls, child, reward_type=REWARD_TYPES.Point):
+        """
+        lock the balance row until the end of the transaction,
+        so a spend checked against it can't be overdrawn by a concurrent one
+        """
+        cls.objects.get_or_create(child=child, reward_type=reward_type)
+        return cls.objects.select_for_update().get(child=child, reward_type=reward_type)
+
+    @classmethod
+    def apply(cls, child_id, reward_type, count):
+        updated = cls.objects.filter(child_id=child_id, reward_type=reward_type).update(
+            balance=models.F("balance") + count
+        )
+        if not updated:
+            cls.objects.get_or_create(child_id=child_id, reward_type=reward_type)
+            cls.objects.filter(child_id=child_id, reward_type=reward_type).update(
+                balance=models.F("balance") + count
+            )
+
+    @classmethod
+    def recompute(cls, child_id, reward_type):
+        """
+        :return: the balance summed from the whole history, stored in the balance row
+        """
+        total = RewardHistory.objects.filter(child_id=child_id, reward_type=reward_type).aggregate(
+            total=models.Sum("count")
+        )["total"] or 0
+        cls.objects.update_or_create(child_id=child_id, reward_type=reward_type, defaults={"balance": total})
+        return total
+
+
+@receiver(post_save, sender=RewardHistory)
+def update_reward_balance(sender, instance: RewardHistory, created, **kwargs):
+    if created:
+        RewardBalance.apply(instance.child_id, instance.reward_type, instance.count)
+    else:
+        # edited in the admin, the previous count and type are unknown
+        for reward_type in [REWARD_TYPES.Point, REWARD_TYPES.Star]:
+            RewardBalance.recompute(instance.child_id, reward_type)
+
+
+@receiver(post_delete, sender=RewardHistory)
+def revert_reward_balance(sender, instance: RewardHistory, **kwargs):
+    # no balance is created here, the child may be the one being deleted
+    RewardBalance.objects.filter(child_id=instance.child_id, reward_type=instance.reward_type).update(
+        balance=models.F("balance") - instance.count
+    )
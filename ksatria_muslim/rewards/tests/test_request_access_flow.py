@@ -1,11 +1,14 @@
+from io import StringIO
+
 import pytest
+from django.core.management import call_command
 from django.urls import reverse
 from factory import Faker
 from factory.django import DjangoModelFactory
 
 from ksatria_muslim.children.models import Child
 from ksatria_muslim.packages.models import Package
-from ksatria_muslim.rewards.models import RewardHistory
+from ksatria_muslim.rewards.models import RewardBalance, RewardHistory
 from ksatria_muslim.users.tests.factories import UserFactory
 
 pytestmark = pytest.mark.django_db
@@ -189,3 +192,38 @@ def test_flow_request_access(api_client, parent, child, package):
     assert resp_data["coin_remaining"] == 0
     assert resp_data["duration_remaining"] == 0
     assert resp_data["message"] == "no_coin"
+
+
+def test_request_access_spends_the_balance(api_client, parent, child):
+    RewardHistoryFactory.create(count=5, description="Haha", child=child)
+    api_client.force_authenticate(parent)
+    url = reverse("api:rewardhistory-request-access")
+
+    resp = api_client.post(url, data={"child_id": child.id, "count": -3, "message": "Nonton"})
+    assert resp.json()["permissible"]
+
+    resp = api_client.post(url, data={"child_id": child.id, "count": -3, "message": "Nonton"})
+    assert resp.json()["message"] == "no_coin"
+    assert RewardBalance.get_balance(child) == 2
+
+    # deleting the spend through the ORM puts it back
+    RewardHistory.objects.filter(count=-3).delete()
+    assert RewardBalance.get_balance(child) == 5
+
+
+def test_reconcile_reward_balances(child):
+    RewardHistoryFactory.create(count=5, description="Haha", child=child)
+    # drift the balance without going through the signals
+    RewardBalance.objects.filter(child=child).update(balance=0)
+
+    out = StringIO()
+    call_command("reconcile_reward_balances", stdout=out)
+    assert f"child {child.id} Point: balance 0, history 5" in out.getvalue()
+    assert RewardBalance.get_balance(child) == 0
+
+    call_command("reconcile_reward_balances", "--fix", stdout=StringIO())
+    assert RewardBalance.get_balance(child) == 5
+
+    out = StringIO()
+    call_command("reconcile_reward_balances", stdout=out)
+    assert "All reward balances match the history" in out.getvalue()
@@ -11,3 +11,14 @@ class SensorLogSerializer(serializers.Serializer):
     sensor = serializers.CharField()
     tracked_time = serializers.DateTimeField()
     message = serializers.CharField()
+
+
+class SensorReadingSerializer(serializers.Serializer):
+    sensor = serializers.CharField()
+    tracked_time = serializers.DateTimeField()
+    message = serializers.CharField()
+
+
+class SensorBatchLogSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    readings = SensorReadingSerializer(many=True, allow_empty=False)
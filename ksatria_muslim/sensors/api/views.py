@@ -1,12 +1,14 @@
+from django.db import transaction
 from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from .serializers import SensorLogSerializer, BoardLogSerializer
-from ..models import Board, Sensor, SensorLog, BoardLog
-from ..tasks import send_telegram, record_and_send_video
+from .serializers import SensorBatchLogSerializer, SensorLogSerializer, BoardLogSerializer
+from ..cache import get_board_id, get_sensor_id
+from ..models import Board, BoardLog
+from ..tasks import send_telegram, record_and_send_video, store_sensor_logs
 
 
 @api_view(["POST"])
@@ -27,35 +29,46 @@ def ping_device(request: Request):
 CCTV_LABEL = "selatan"
 
 
+@transaction.non_atomic_requests
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def log_sensor(request: Request):
-    serializer = SensorLogSerializer(data=request.data)
-    serializer.is_valid(raise_exception=True)
+    """
+    Accepts one reading, or a batch of them as `readings`. The board and sensors come from the cache,
+    the readings are stored by a worker in one insert.
+    """
+    if "readings" in request.data:
+        serializer = SensorBatchLogSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        readings = serializer.validated_data["readings"]
+    else:
+        serializer = SensorLogSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        readings = [serializer.validated_data]
 
-    try:
-        board = Board.objects.get(token=serializer.validated_data["token"])
-    except Board.DoesNotExist:
+    board_id = get_board_id(serializer.validated_data["token"])
+    if board_id is None:
         return Response({"error": "board not found"}, status=404)
 
-    sensor, _ = Sensor.objects.get_or_create(
-        board=board,
-        label=serializer.validated_data["sensor"],
-        type="Pir"
-    )
-
-    SensorLog.objects.create(
-        sensor=sensor,
-        tracked_date=serializer.validated_data["tracked_time"],
-        message=serializer.validated_data["message"]
-    )
+    readings = sorted(readings, key=lambda reading: reading["tracked_time"])
+    sensor_ids = {reading["sensor"]: get_sensor_id(board_id, reading["sensor"]) for reading in readings}
+    store_sensor_logs.delay([
+        [sensor_ids[reading["sensor"]], reading["tracked_time"].isoformat(), reading["message"]]
+        for reading in readings
+    ])
 
-    localtime = timezone.localtime(serializer.validated_data["tracked_time"])
+    # one notification and one recording for the whole burst
     fmt = "%d/%m/%Y %H:%M:%S WIB"
-    send_telegram.delay(
-        text=f"Pergerakan terdeteksi di sensor '{sensor.label}'\n\n{localtime.strftime(fmt)}"
+    detections = "\n\n".join(
+        f"Pergerakan terdeteksi di sensor '{reading['sensor']}'\n\n"
+        f"{timezone.localtime(reading['tracked_time']).strftime(fmt)}"
+        for reading in readings
     )
+    send_telegram.delay(text=detections)
 
-    record_and_send_video.delay(CCTV_LABEL, f"{sensor.label} - {localtime.strftime(fmt)}")
+    first = readings[0]
+    record_and_send_video.delay(
+        CCTV_LABEL, f"{first['sensor']} - {timezone.localtime(first['tracked_time']).strftime(fmt)}"
+    )
 
     return Response({"message": "ok"})
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from ksatria_muslim.sensors.models import Board, Sensor
+
+BOARD_TOKEN_KEY = "sensors:board-token:{}"
+SENSOR_KEY = "sensors:sensor:{}:{}"
+
+
+def get_board_id(token):
+    """
+    :return: id of the board of the token, None when there is none
+    """
+    key = BOARD_TOKEN_KEY.format(token)
+    board_id = cache.get(key)
+    if board_id is None:
+        # unknown tokens are not cached, random ones must not fill the cache
+        board_id = Board.objects.filter(token=token).values_list("id", flat=True).first()
+        if board_id is not None:
+            cache.set(key, board_id, settings.SENSOR_CACHE_TIMEOUT)
+    return board_id
+
+
+def get_sensor_id(board_id, label):
+    key = SENSOR_KEY.format(board_id, label)
+    sensor_id = cache.get(key)
+    if sensor_id is None:
+        sensor, _ = Sensor.objects.get_or_create(board_id=board_id, label=label, type=Sensor.CHOICES.Pir)
+        sensor_id = sensor.id
+        cache.set(key, sensor_id, settings.SENSOR_CACHE_TIMEOUT)
+    return sensor_id
+
+
+def invalidate_board_token(token):
+    cache.delete(BOARD_TOKEN_KEY.format(token))
+
+
+def invalidate_sensor(board_id, label):
+    cache.delete(SENSOR_KEY.format(board_id, label))
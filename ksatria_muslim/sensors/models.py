@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
 from model_utils import Choices
 from model_utils.models import TimeStampedModel
 
@@ -34,6 +36,42 @@ class BoardLog(TimeStampedModel):
     board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name="logs")
 
 
+@receiver(pre_save, sender=Board)
+def invalidate_changed_board_token(sender, instance: Board, **kwargs):
+    from ksatria_muslim.sensors.cache import invalidate_board_token
+
+    # the cached board of the previous token must not keep logging
+    if instance.pk:
+        previous = Board.objects.filter(pk=instance.pk).values_list("token", flat=True).first()
+        if previous is not None and previous != instance.token:
+            invalidate_board_token(previous)
+
+
+@receiver(post_delete, sender=Board)
+def invalidate_deleted_board_token(sender, instance: Board, **kwargs):
+    from ksatria_muslim.sensors.cache import invalidate_board_token
+
+    invalidate_board_token(instance.token)
+
+
+@receiver(pre_save, sender=Sensor)
+def invalidate_changed_sensor(sender, instance: Sensor, **kwargs):
+    from ksatria_muslim.sensors.cache import invalidate_sensor
+
+    # the readings of the previous board and label must not keep going to this sensor
+    if instance.pk:
+        previous = Sensor.objects.filter(pk=instance.pk).values_list("board_id", "label").first()
+        if previous is not None and previous != (instance.board_id, instance.label):
+            invalidate_sensor(*previous)
+
+
+@receiver(post_delete, sender=Sensor)
+def invalidate_deleted_sensor(sender, instance: Sensor, **kwargs):
+    from ksatria_muslim.sensors.cache import invalidate_sensor
+
+    invalidate_sensor(instance.board_id, instance.label)
+
+
 
 class ImouAccount(TimeStampedModel):
     appid = models.TextField()
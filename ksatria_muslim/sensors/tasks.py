@@ -1,8 +1,9 @@
 import requests
+from django.utils.dateparse import parse_datetime
 
 from config import celery_app
 from ksatria_muslim.sensors.di import sensors_composition_root
-from ksatria_muslim.sensors.models import CCTVCamera
+from ksatria_muslim.sensors.models import CCTVCamera, SensorLog
 
 
 @celery_app.task()
@@ -13,6 +14,17 @@ def send_telegram(text):
     resp.close()
 
 
+@celery_app.task()
+def store_sensor_logs(readings):
+    """
+    :param readings: [sensor id, iso tracked time, message] of each reading, stored in one insert
+    """
+    SensorLog.objects.bulk_create([
+        SensorLog(sensor_id=sensor_id, tracked_date=parse_datetime(tracked_time), message=message)
+        for sensor_id, tracked_time, message in readings
+    ])
+
+
 @celery_app.task(soft_time_limit=180, time_limit=180)
 def record_and_send_video(cctv_label, caption):
     cctv = CCTVCamera.objects.filter(label=cctv_label).first()
@@ -0,0 +1,20 @@
+import pytest
+from django.core.cache import cache
+
+from ksatria_muslim.sensors.cache import get_sensor_id
+from ksatria_muslim.sensors.models import Board, Sensor
+
+pytestmark = pytest.mark.django_db
+
+
+def test_renamed_sensor_is_not_used_for_its_old_label():
+    cache.clear()
+    board = Board.objects.create(label="Kamar", token="secret")
+    sensor_id = get_sensor_id(board.id, "pintu")
+
+    sensor = Sensor.objects.get(pk=sensor_id)
+    sensor.label = "jendela"
+    sensor.save()
+
+    assert get_sensor_id(board.id, "pintu") != sensor_id
+    assert get_sensor_id(board.id, "jendela") == sensor_id
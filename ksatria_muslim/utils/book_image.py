@@ -1,9 +1,15 @@
+import contextlib
 import datetime
+import functools
+import hashlib
 import io
 import itertools
 import json
 import os
 import re
+import shutil
+import tempfile
+import zipfile
 
 from PIL import Image, ImageFont, ImageDraw
 from django.conf import settings
@@ -11,6 +17,8 @@ from django.contrib.staticfiles.finders import find
 from django.core.files.storage import default_storage
 from pyarabic import araby
 
+from ksatria_muslim.utils.storage import AssetWriter, overwrite_file, read_files
+
 
 def base_split_words(text, arabic):
     if arabic:
@@ -18,7 +26,7 @@ def base_split_words(text, arabic):
     return text.split(" ")
 
 
-def save_page_data(file_name, dimen_name, page_data):
+def save_page_data(file_name, dimen_name, page_data, writer):
     response = {"page_data": []}
     for word, bboxes in page_data:
         word_resp = {"text": word, "bboxes": []}
@@ -32,23 +40,20 @@ def save_page_data(file_name, dimen_name, page_data):
             })
         response["page_data"].append(word_resp)
 
-    byteio = io.StringIO()
-    json.dump(response, byteio)
     final_path = f"book_image_metadata/{file_name}-{dimen_name}.json"
-    if default_storage.exists(final_path):
-        default_storage.delete(final_path)
-    default_storage.save(final_path, byteio)
-    byteio.close()
-
+    writer.add(final_path, json.dumps(response))
 
-def fix_non_arabic_page_data(text, page_data):
-    split_text = split_words(settings.BOOK_SPECIAL_WORDS, text)
-    final = [(word, []) for word in split_text]
 
+def get_words_and_index(split_text):
     words_and_index = []
     for index, line in enumerate(split_text):
         for word in line.split(" "):
             words_and_index.append((word, index))
+    return words_and_index
+
+
+def fix_non_arabic_page_data(split_text, words_and_index, page_data):
+    final = [(word, []) for word in split_text]
 
     for data, word_and_index in zip(page_data, words_and_index):
         word, left, top, right, bottom = data
@@ -103,96 +108,164 @@ def fix_arabic_page_data(page_data):
     return [[text, bboxes]]
 
 
-def process_page_image(text, file_name, arabic=False):
+class PageLayout:
+    """
+    the text analysis of one page, done once and shared by every density:
+    the words to wrap, and which bbox entry of the metadata each word belongs to.
+    Only the wrapping and the boxes depend on the font size.
+    """
+
+    def __init__(self, text, arabic=False):
+        self.text = normalize_text(text)
+        self.arabic = arabic
+        self.words = base_split_words(self.text, arabic)
+
+        if arabic:
+            self.split_text = [self.text]
+            self.words_and_index = []
+        else:
+            self.split_text = split_words(settings.BOOK_SPECIAL_WORDS, self.text)
+            self.words_and_index = get_words_and_index(self.split_text)
+
+    def to_page_data(self, page_data):
+        if self.arabic:
+            return fix_arabic_page_data(page_data)
+
+        page_data = fix_non_arabic_page_data(self.split_text, self.words_and_index, page_data)
+        return normalize_lines(page_data)
+
+
+def process_page_image(text, file_name, arabic=False, sizes=None):
     """
     the main function used for generating image from the text
 
     :param text: text we want to render it into image
     :param file_name: base file name used to save image, and it's bounding boxes
     :param arabic: check is the text arabic or not
+    :param sizes: items of ``BOOK_IMAGE_SIZES`` to render, all of them by default
     :return: Nothing
     """
+    layout = PageLayout(text, arabic)
+    writer = AssetWriter()
+    for size in sizes or settings.BOOK_IMAGE_SIZES:
+        render_page_layout(layout, file_name, size, writer)
+    writer.flush()
 
-    # we replace new lines
-    text = text.replace("\n", " ").strip()
 
-    sizes = settings.BOOK_IMAGE_SIZES
-    for image_size, font_size, dimen_name in sizes:
-        font = initialize_font(font_size, arabic)
-        space_box = font.getbbox(" ")
+def render_page_layout(layout, file_name, size, writer):
+    """
+    render the page layout into one density bucket of ``BOOK_IMAGE_SIZES``
 
-        image = Image.new("RGBA", image_size, (0, 0, 0, 0))
-        canvas = ImageDraw.Draw(image)
-        words = base_split_words(text, arabic)
-        lines = wrap_text(words, font, image.width * 0.8)
-        y, line_heights = get_y_and_heights(lines, image.size, 0, font)
+    :param layout: PageLayout of the page
+    :param file_name: base file name used to save image, and it's bounding boxes
+    :param size: one item of ``BOOK_IMAGE_SIZES``, (image_size, font_size, dimen_name)
+    :param writer: AssetWriter collecting the image and the bounding boxes
+    :return: Nothing
+    """
+    image_size, font_size, dimen_name = size
+    font = initialize_font(font_size, layout.arabic)
+    metrics = get_font_metrics(font)
+    space_box = metrics.getbbox(" ")
 
-        page_data = []
+    image = Image.new("RGBA", image_size, (0, 0, 0, 0))
+    canvas = ImageDraw.Draw(image)
+    lines = wrap_text(layout.words, font, image.width * 0.8)
+    y, line_heights = get_y_and_heights(lines, image.size, 0, font)
 
-        for idx, line in enumerate(lines):
-            x = image.width // 2
+    page_data = []
 
-            canvas.text((x + 1, y + 1), line, font=font, anchor="ma", fill="grey")
-            canvas.text((x, y), line, font=font, anchor="ma", fill="black")
+    for idx, line in enumerate(lines):
+        x = image.width // 2
 
-            box_line = canvas.textbbox((x, y), line, font=font, anchor="ma")
+        canvas.text((x + 1, y + 1), line, font=font, anchor="ma", fill="grey")
+        canvas.text((x, y), line, font=font, anchor="ma", fill="black")
 
-            if arabic:
-                page_data.append([text] + list(box_line))
-                y += line_heights[idx]
-                continue
+        box_line = canvas.textbbox((x, y), line, font=font, anchor="ma")
 
-            box_left, box_top, box_right, box_bottom = box_line
+        if layout.arabic:
+            page_data.append([layout.text] + list(box_line))
+            y += line_heights[idx]
+            continue
 
-            word_x = box_left
-            for word in base_split_words(line, arabic):
-                word_left, word_top, word_right, word_bottom = font.getbbox(word)
+        box_left, box_top, box_right, box_bottom = box_line
 
-                word_final_box = (word_left + word_x, box_top, word_right + word_x, box_bottom)
+        word_x = box_left
+        for word in base_split_words(line, layout.arabic):
+            word_left, word_top, word_right, word_bottom = metrics.getbbox(word)
 
-                # increase x
-                word_x += word_right + space_box[2]
+            word_final_box = (word_left + word_x, box_top, word_right + word_x, box_bottom)
 
-                page_data.append([word] + list(word_final_box))
+            # increase x
+            word_x += word_right + space_box[2]
 
-            y += line_heights[idx]
+            page_data.append([word] + list(word_final_box))
 
-        # finalize data
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        final_fname = f"books_image/{file_name}-{dimen_name}.png"
-        if default_storage.exists(final_fname):
-            default_storage.delete(final_fname)
-        default_storage.save(final_fname, img_byte_arr)
-        image.close()
-        img_byte_arr.close()
+        y += line_heights[idx]
 
-        if arabic:
-            page_data = fix_arabic_page_data(page_data)
-            save_page_data(file_name, dimen_name, page_data)
-            continue
+    # finalize data, the writer uploads and closes the encoded stream
+    img_byte_arr = io.BytesIO()
+    encode_page_image(image, img_byte_arr)
+    img_byte_arr.seek(0)
+    final_fname = f"books_image/{file_name}-{dimen_name}.{page_image_extension()}"
+    writer.add(final_fname, img_byte_arr)
+    image.close()
+
+    save_page_data(file_name, dimen_name, layout.to_page_data(page_data), writer)
 
-        page_data = fix_non_arabic_page_data(text, page_data)
-        page_data = normalize_lines(page_data)
-        save_page_data(file_name, dimen_name, page_data)
+
+def page_image_extension():
+    return settings.BOOK_IMAGE_ENCODER["format"]
+
+
+def encode_page_image(image, stream):
+    """
+    encode the rendered RGBA page image into the stream with ``BOOK_IMAGE_ENCODER``
+
+    - png: ``compress_level`` 0-9, and ``quantize`` to a 256 colors palette.
+      the pages are mostly transparent black text, the palette keeps the transparency
+    - webp: always lossless
+
+    :param image: rendered RGBA image
+    :param stream: binary file object to write into
+    :return: Nothing
+    """
+    encoder = settings.BOOK_IMAGE_ENCODER
+    if encoder["format"] == "webp":
+        image.save(stream, format="WEBP", lossless=True)
+        return
+
+    if encoder.get("quantize"):
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    image.save(stream, format="PNG", compress_level=encoder.get("compress_level", 6))
+
+
+def normalize_text(text):
+    # we replace new lines
+    return text.replace("\n", " ").strip()
 
 
 def wrap_text(words, font, max_width):
+    metrics = get_font_metrics(font)
+    space_length = metrics.getlength(" ")
+
     # simpan list
     lines = []
-    # simpan current_line
+    # simpan current_line, dan panjangnya
     current_line = ""
+    current_length = 0
     # untuk setiap word:
     for word in words:
-    # temp_line = current + word + " " // temp_line = " ".join(current, word)
-        temp_line = " ".join([current_line, word])
+        # lebar " ".join([current_line, word]) = panjang current_line + spasi + lebar word,
+        # jadi tidak perlu mengukur ulang seluruh line
+        width = current_length + space_length + metrics.getbbox(word)[2]  # x,y,x,y
     # hitung >= max_width -> menambahkan ke list + current line == word ?: current line = temp line
-        width = font.getbbox(temp_line)[2]  # x,y,x,y
         if width >= max_width:
             lines.append(current_line.strip())
             current_line = word
+            current_length = metrics.getlength(word)
         else:
-            current_line = temp_line
+            current_line = " ".join([current_line, word])
+            current_length += space_length + metrics.getlength(word)
 
     # keluar dari loop -> jangan lupa tambahkan current line
     lines.append(current_line.strip())
@@ -240,16 +313,41 @@ def split_words(special_words, text):
     return final_words
 
 
-def initialize_font(font_size, arabic=False):
+def get_font_name(arabic=False):
     if arabic:
-        font_name = "uthman-toha.ttf"
-    else:
-        font_name = "BookWorm.ttf"
+        return "uthman-toha.ttf"
+    return "BookWorm.ttf"
+
 
+def initialize_font(font_size, arabic=False):
+    font_name = get_font_name(arabic)
     abs_font_path = os.path.join(settings.FONTS_DIRECTORY, font_name)
+    return load_font(abs_font_path, font_size)
+
+
+@functools.lru_cache(maxsize=32)
+def load_font(abs_font_path, font_size):
+    """process wide cache of the loaded fonts, keyed by (font path, size)"""
     return ImageFont.truetype(abs_font_path, font_size)
 
 
+class FontMetrics:
+    """
+    cached measurement of single words for one font, the same words are
+    measured over and over again across the pages of a book
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.getbbox = functools.lru_cache(maxsize=4096)(font.getbbox)
+        self.getlength = functools.lru_cache(maxsize=4096)(font.getlength)
+
+
+@functools.lru_cache(maxsize=32)
+def get_font_metrics(font):
+    return FontMetrics(font)
+
+
 def is_arabic(text):
     """
     check the text is arabic or not. Just check if any arabic character
@@ -262,11 +360,135 @@ def is_arabic(text):
     return resp is not None
 
 
-def stamp_book(f_name):
+def stamp_book(f_name, writer):
     final_f_name = f"books_image/{f_name}"
-    if default_storage.exists(final_f_name):
-        default_storage.delete(final_f_name)
+    writer.add(final_f_name, str(datetime.datetime.now().timestamp()))
+
+
+# bump this when the rendering output changes, so every page is re-rendered
+RENDER_VERSION = 1
+
+
+def page_render_key(text, size, arabic=False):
+    """
+    hash of every input that affects one rendered page image and its bounding boxes
+
+    :param text: page text
+    :param size: one item of ``BOOK_IMAGE_SIZES``
+    :param arabic: check is the text arabic or not
+    :return: hex digest
+    """
+    image_size, font_size, dimen_name = size
+    payload = json.dumps([
+        RENDER_VERSION,
+        normalize_text(text),
+        get_font_name(arabic),
+        list(image_size),
+        font_size,
+        dimen_name,
+        settings.BOOK_SPECIAL_WORDS,
+        settings.BOOK_IMAGE_ENCODER,
+    ])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def render_manifest_path(book_id):
+    return f"book_image_metadata/books/{book_id}/manifest.json"
+
+
+def load_render_manifest(book_id):
+    """
+    :return: {page: {dimen_name: render key}} of the last finished render
+    """
+    path = render_manifest_path(book_id)
+    if not default_storage.exists(path):
+        return {}
+
+    with default_storage.open(path) as f:
+        return json.load(f)
+
+
+def save_render_manifest(book_id, manifest):
+    overwrite_file(render_manifest_path(book_id), json.dumps(manifest))
+
+
+def book_bundle_path(book_id, dimen_name):
+    return f"books_image/books/{book_id}/bundle-{dimen_name}.zip"
+
+
+def load_bundle_index(book_id, dimen_name):
+    """
+    :return: ``index.json`` of the book bundle, None if the book has no bundle yet
+    """
+    path = book_bundle_path(book_id, dimen_name)
+    if not default_storage.exists(path):
+        return None
+
+    with default_storage.open(path) as f, zipfile.ZipFile(f) as bundle:
+        return json.loads(bundle.read("index.json"))
+
+
+def pack_book_bundle(book_id, pages, dimen_name, changed_pages=None):
+    """
+    pack the page images of one density and their bounding boxes into one
+    uncompressed zip. ``index.json`` is the last member, it holds the bounding boxes
+    of every page and the offset and length of each page image inside the bundle,
+    so a client can download the whole bundle or range request a single page.
+
+    The pages not in `changed_pages` are copied from the current bundle, only the changed
+    ones and the ones missing from it are read from the storage, concurrently.
+
+    :param book_id: book id
+    :param pages: page numbers, already rendered
+    :param dimen_name: density name of ``BOOK_IMAGE_SIZES``
+    :param changed_pages: page numbers rendered since the current bundle, None to read every page
+    :return: temporary file of the bundle, at position 0
+    """
+    extension = page_image_extension()
+    index = {"book_id": book_id, "dimen": dimen_name, "pages": []}
+    stream = tempfile.SpooledTemporaryFile(max_size=settings.BOOK_BUNDLE_SPOOL_SIZE)
+
+    with contextlib.ExitStack() as stack:
+        previous, previous_pages = None, {}
+        path = book_bundle_path(book_id, dimen_name)
+        if changed_pages is not None and default_storage.exists(path):
+            previous = stack.enter_context(zipfile.ZipFile(stack.enter_context(default_storage.open(path))))
+            previous_pages = {item["page"]: item for item in json.loads(previous.read("index.json"))["pages"]}
+
+        changed_pages = set(changed_pages or ())
+        read_pages = [page for page in pages if page in changed_pages or page not in previous_pages]
+        images = read_files(
+            [f"books_image/books/{book_id}/{page}-{dimen_name}.{extension}" for page in read_pages],
+            lambda f: f.read(),
+        )
+        page_datas = read_files(
+            [f"book_image_metadata/books/{book_id}/{page}-{dimen_name}.json" for page in read_pages],
+            lambda f: json.load(f).get("page_data", []),
+        )
+        stack.callback(images.close)
+        stack.callback(page_datas.close)
+
+        bundle = stack.enter_context(zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED))
+        for page in pages:
+            name = f"{page}.{extension}"
+            if page in previous_pages and page not in changed_pages:
+                with previous.open(previous_pages[page]["image"]) as source, bundle.open(name, "w") as target:
+                    shutil.copyfileobj(source, target)
+                page_data = previous_pages[page]["page_data"]
+            else:
+                bundle.writestr(name, next(images))
+                page_data = next(page_datas)
+
+            info = bundle.getinfo(name)
+            index["pages"].append({
+                "page": page,
+                "image": name,
+                "offset": info.header_offset + zipfile.sizeFileHeader + len(info.filename.encode()) + len(info.extra),
+                "length": info.file_size,
+                "page_data": page_data,
+            })
+
+        bundle.writestr("index.json", json.dumps(index))
 
-    timestamp = io.StringIO(str(datetime.datetime.now().timestamp()))
-    default_storage.save(final_f_name, timestamp)
-    timestamp.close()
+    stream.seek(0)
+    return stream
@@ -0,0 +1,81 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+
+
+def overwrite_file(name, content, storage=default_storage):
+    """
+    save the content under exactly that name, replacing the existing file
+
+    :param name: file name in the storage
+    :param content: bytes, str or a binary file object
+    :param storage: django storage, `default_storage` by default
+    :return: saved name
+    """
+    if not getattr(storage, "file_overwrite", False):
+        # FileSystemStorage renames on conflict, the check is a local stat.
+        # Remote storages like S3 with `file_overwrite` replace the key in place.
+        if storage.exists(name):
+            storage.delete(name)
+
+    if isinstance(content, (bytes, str)):
+        return storage.save(name, ContentFile(content))
+
+    # file objects are streamed by the storage in chunks, not read into another copy
+    with File(content, name=name) as f:
+        return storage.save(name, f)
+
+
+class AssetWriter:
+    """
+    collects files to write, and writes all of them concurrently on `flush`
+    through a bounded thread pool of `BOOK_ASSET_UPLOAD_WORKERS` threads
+    """
+
+    def __init__(self, storage=default_storage):
+        self.storage = storage
+        self.files = []
+
+    def add(self, name, content):
+        self.files.append((name, content))
+
+    def flush(self):
+        files, self.files = self.files, []
+        if not files:
+            return
+
+        with ThreadPoolExecutor(max_workers=settings.BOOK_ASSET_UPLOAD_WORKERS) as executor:
+            # consume the results so the first failed upload is raised
+            list(executor.map(lambda item: overwrite_file(*item, storage=self.storage), files))
+
+
+def read_files(names, load, storage=default_storage):
+    """
+    read the files concurrently through `BOOK_ASSET_UPLOAD_WORKERS` threads,
+    keeping only a few of them in flight ahead of the one being consumed
+
+    :param names: file names in the storage
+    :param load: called with each opened file, its result is yielded
+    :param storage: django storage, `default_storage` by default
+    :return: generator of the results, in the order of `names`
+    """
+    def read(name):
+        with storage.open(name) as f:
+            return load(f)
+
+    workers = settings.BOOK_ASSET_UPLOAD_WORKERS
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for name in names:
+            pending.append(executor.submit(read, name))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # the consumer may stop early, e.g. a client closing the download
+        executor.shutdown(cancel_futures=True)